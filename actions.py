@@ -0,0 +1,244 @@
+import asyncio
+import discord
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, List, Mapping, Optional
+
+from compact_activity import DAY, CompactActivity
+from metrics import Metrics
+from role_index import RoleIndex
+
+DEMOTE = "demote"
+RESTORE = "restore"
+KICK = "kick"
+
+# A member is never kicked sooner than this after their demotion notice, however long they
+# were inactive before it
+KICK_NOTICE = DAY
+
+
+def is_cleaner(member_id: int, cleaner_role: Optional[discord.Role], role_index: RoleIndex) -> bool:
+    """Cleaner as planning and deadlines see it: nobody, while the guild has no Cleaner role."""
+    return cleaner_role is not None and role_index.is_cleaner(member_id)
+
+
+@dataclass
+class PlannedAction:
+    member: discord.Member
+    kind: str  # DEMOTE, RESTORE or KICK
+    reason: str
+    days: int  # days inactive, or days since join for members never active
+    never_active: bool = False
+    roles: Optional[List[discord.Role]] = None  # full role list after a DEMOTE/RESTORE
+    removed_roles: List[discord.Role] = field(default_factory=list)
+
+
+def plan_inactivity_actions(
+    guild: discord.Guild,
+    activity: CompactActivity,
+    now: datetime,
+    cleaner_role: Optional[discord.Role],
+    soldier_role: Optional[discord.Role],
+    role_index: RoleIndex,
+    inactivity_days: int,
+    kick_days: int,
+    demoted_at: Optional[Mapping[int, float]] = None,
+) -> List[PlannedAction]:
+    """
+    Decide what the inactivity check should do without touching Discord.
+    Role changes are folded into the member's final role list so each member
+    needs at most one API call. `demoted_at` holds when members were demoted
+    by this run of the bot, for the KICK_NOTICE period.
+
+    Members active within `inactivity_days` are one band of the activity time
+    index; unless they are Cleaners (who may be restored) nothing can happen
+    to them, so they are skipped without being looked at one by one.
+    """
+    now_ts = now.timestamp()
+    recent = set(activity.split([now_ts - inactivity_days * DAY])[1][0])
+    plan: List[PlannedAction] = []
+    skipped = 0
+    for member in guild.members:
+        if member.id in recent and not is_cleaner(member.id, cleaner_role, role_index):
+            skipped += 1
+            continue
+        action = plan_member_action(
+            member, guild, activity, now, cleaner_role, soldier_role, role_index, inactivity_days, kick_days,
+            demoted_at,
+        )
+        if action:
+            plan.append(action)
+    print(f"Skipping {skipped} members: Active in last {inactivity_days} days")
+    return plan
+
+
+def plan_member_action(
+    member: discord.Member,
+    guild: discord.Guild,
+    activity: CompactActivity,
+    now: datetime,
+    cleaner_role: Optional[discord.Role],
+    soldier_role: Optional[discord.Role],
+    role_index: RoleIndex,
+    inactivity_days: int,
+    kick_days: int,
+    demoted_at: Optional[Mapping[int, float]] = None,
+) -> Optional[PlannedAction]:
+    """The action the inactivity check takes for one member, if any."""
+    if member.bot or role_index.is_exempt(member.id):
+        print(f"Skipping {member.display_name} ({member.id}): Bot or exempt role")
+        return None
+
+    exempt_role_ids = role_index.exempt_role_ids
+    now_ts = now.timestamp()
+    last_active = activity.timestamp(member.id)
+    days_since_join = int((now_ts - (member.joined_at or now).timestamp()) // DAY)
+    days_since = int((now_ts - last_active) // DAY) if last_active is not None else None
+
+    if days_since_join < inactivity_days and (days_since is None or days_since < inactivity_days):
+        print(f"Skipping {member.display_name} ({member.id}): Joined {days_since_join} days ago or active in last {inactivity_days} days")
+        return None
+
+    cleaner = is_cleaner(member.id, cleaner_role, role_index)
+    noticed = demoted_at is None or now_ts >= demoted_at.get(member.id, 0.0) + KICK_NOTICE
+
+    # 🧹 Handle members who never became active
+    if last_active is None:
+        print(f"{member.display_name} ({member.id}) has never been active, joined {days_since_join} days ago")
+
+        if cleaner and days_since_join >= kick_days and noticed:
+            return PlannedAction(
+                member, KICK, f"Inactive for more than {kick_days} days (never active)",
+                days_since_join, never_active=True,
+            )
+        if not cleaner and days_since_join >= inactivity_days:
+            return demotion(
+                member, guild, cleaner_role, soldier_role, exempt_role_ids,
+                "Inactive (never active)", days_since_join, never_active=True,
+            )
+        return None
+
+    # ✅ Became active again
+    if cleaner and last_active >= now_ts - inactivity_days * DAY:
+        print(f"{member.display_name} ({member.id}) is Cleaner but became active again")
+        roles = [r for r in member.roles if r != cleaner_role and r != guild.default_role]
+        return PlannedAction(
+            member, RESTORE, "Active again", days_since, roles=roles, removed_roles=[cleaner_role],
+        )
+
+    # 🚫 Kick after kick_days of inactivity (verification step)
+    if cleaner and last_active < now_ts - kick_days * DAY and noticed:
+        print(f"{member.display_name} ({member.id}) is overdue for kick ({days_since} days inactive)")
+        return PlannedAction(member, KICK, f"Inactive for {days_since} days", days_since)
+
+    # 🧹 Mark as inactive if over inactivity_days and not yet a Cleaner
+    if not cleaner and last_active < now_ts - inactivity_days * DAY:
+        print(f"{member.display_name} ({member.id}) is overdue for Cleaner role ({days_since} days inactive)")
+        return demotion(
+            member, guild, cleaner_role, soldier_role, exempt_role_ids,
+            f"Inactive {inactivity_days}+ days", days_since,
+        )
+    return None
+
+
+def member_deadline(
+    member: discord.Member,
+    activity: CompactActivity,
+    cleaner_role: Optional[discord.Role],
+    role_index: RoleIndex,
+    now_ts: float,
+    inactivity_days: int,
+    kick_days: int,
+    demoted_at: Optional[Mapping[int, float]] = None,
+) -> Optional[float]:
+    """
+    When `plan_member_action` next has something to do for this member, as a
+    Unix timestamp: demotion for members without Cleaner, the kick for
+    Cleaners, or right away for a Cleaner who is active again. None for bots
+    and exempt members, who are never touched.
+    """
+    if member.bot or role_index.is_exempt(member.id):
+        return None
+    last_active = activity.timestamp(member.id)
+    joined = member.joined_at.timestamp() if member.joined_at else None
+    if is_cleaner(member.id, cleaner_role, role_index):
+        if last_active is not None and last_active >= now_ts - inactivity_days * DAY:
+            # Members who joined recently are left alone until inactivity_days after joining
+            return max(now_ts, joined + inactivity_days * DAY) if joined is not None else now_ts
+        start = last_active if last_active is not None else joined
+        if start is None:
+            return None
+        noticed = demoted_at.get(member.id, 0.0) + KICK_NOTICE if demoted_at else 0.0
+        return max(start + kick_days * DAY, noticed)
+    known = [t for t in (last_active, joined) if t is not None]
+    return max(known) + inactivity_days * DAY if known else None
+
+
+def demotion(member, guild, cleaner_role, soldier_role, exempt_role_ids, reason, days, never_active=False):
+    """Strip every non-exempt role and leave the member with Cleaner and Soldier."""
+    removed = [r for r in member.roles if r.id not in exempt_role_ids and r != guild.default_role]
+    roles = [r for r in member.roles if r.id in exempt_role_ids and r != guild.default_role]
+    for role in (cleaner_role, soldier_role):
+        if role and role not in roles:
+            roles.append(role)
+    return PlannedAction(
+        member, DEMOTE, reason, days, never_active=never_active, roles=roles, removed_roles=removed,
+    )
+
+
+async def apply_action(action: PlannedAction):
+    """The single Discord API call behind an action."""
+    if action.kind == KICK:
+        await action.member.kick(reason=action.reason)
+    else:
+        await action.member.edit(roles=action.roles, reason=action.reason)
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return isinstance(error, discord.HTTPException) and error.status >= 500
+
+
+async def execute_actions(
+    plan: List[PlannedAction],
+    on_success: Callable[[PlannedAction], Awaitable[None]],
+    on_error: Callable[[PlannedAction, Exception], Awaitable[None]],
+    concurrency: int = 5,
+    retries: int = 2,
+    retry_delay: float = 1.0,
+    metrics: Optional[Metrics] = None,
+):
+    """
+    Run a plan with at most `concurrency` members in flight. Timeouts and 5xx
+    responses are retried with backoff; anything else (e.g. Forbidden) goes
+    straight to `on_error` together with the action that failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(action: PlannedAction):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                if metrics:
+                    metrics.inc("rest_calls_total", kind=action.kind)
+                try:
+                    await apply_action(action)
+                    break
+                except Exception as e:
+                    if attempt < retries and is_transient(e):
+                        if metrics:
+                            metrics.inc("action_retries_total", kind=action.kind)
+                        await asyncio.sleep(retry_delay * (2 ** attempt))
+                        continue
+                    if metrics:
+                        metrics.inc("actions_total", kind=action.kind, result="failed")
+                    await on_error(action, e)
+                    return
+        if metrics:
+            metrics.inc("actions_total", kind=action.kind, result="ok")
+        try:
+            await on_success(action)
+        except Exception as e:
+            await on_error(action, e)
+
+    await asyncio.gather(*(run(action) for action in plan))
@@ -0,0 +1,296 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+from compact_activity import CompactActivity
+from metrics import Metrics
+from scanner import ChannelProgress
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open the activity database for sharing between processes: WAL lets
+    readers see a consistent state while another process writes, and the
+    busy timeout makes concurrent writers queue up instead of failing.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@dataclass
+class ScanCheckpoint:
+    """What an interrupted scan of one guild had done before it stopped."""
+    since: datetime  # lookback of the interrupted scan; the resumed one must use the same
+    started: datetime
+    channels: Dict[int, ChannelProgress]
+    activity: Dict[int, datetime]  # authors folded in up to each channel's saved cursor
+
+
+class ActivityStore:
+    """
+    SQLite-backed copy of one guild's activity cache so a restart doesn't need
+    a full rescan. Several guilds can share a database file, every row is
+    keyed by guild ID, and several bot processes may use the same file. A
+    finished scan is stored as one snapshot row holding the raw
+    `CompactActivity` arrays; live updates since then are coalesced in memory
+    (newest timestamp per member) and written in batches by `flush()` to the
+    `guild_activity` table, on a timer or once `max_pending` members are dirty.
+    A scan in progress checkpoints its per-channel cursors and the authors
+    seen so far, so that a restarted bot resumes it instead of starting over.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        guild_id: int,
+        conn: Optional[sqlite3.Connection] = None,
+        max_pending: int = 5000,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.path = path
+        self.guild_id = guild_id
+        self.max_pending = max_pending
+        self.metrics = metrics
+        self._owns_conn = conn is None
+        self._conn = conn or connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS guild_activity ("
+            " guild_id INTEGER NOT NULL,"
+            " member_id INTEGER NOT NULL,"
+            " last_active REAL NOT NULL,"
+            " PRIMARY KEY (guild_id, member_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS guild_snapshots ("
+            " guild_id INTEGER PRIMARY KEY,"
+            " member_ids BLOB NOT NULL,"
+            " last_active BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_watermarks ("
+            " guild_id INTEGER NOT NULL,"
+            " channel_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " PRIMARY KEY (guild_id, channel_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS archive_marks ("
+            " guild_id INTEGER NOT NULL,"
+            " channel_id INTEGER NOT NULL,"
+            " listed_at REAL NOT NULL,"
+            " PRIMARY KEY (guild_id, channel_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_runs ("
+            " guild_id INTEGER PRIMARY KEY,"
+            " since REAL NOT NULL,"
+            " started REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_progress ("
+            " guild_id INTEGER NOT NULL,"
+            " channel_id INTEGER NOT NULL,"
+            " after_id INTEGER NOT NULL,"
+            " newest_id INTEGER,"
+            " cursor_id INTEGER,"
+            " messages INTEGER NOT NULL,"
+            " done INTEGER NOT NULL,"
+            " PRIMARY KEY (guild_id, channel_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_activity ("
+            " guild_id INTEGER NOT NULL,"
+            " member_id INTEGER NOT NULL,"
+            " last_active REAL NOT NULL,"
+            " PRIMARY KEY (guild_id, member_id))"
+        )
+        self._conn.commit()
+        self._pending: Dict[int, float] = {}
+
+    def load(self) -> CompactActivity:
+        """
+        The last snapshot with every live update written since applied on top,
+        read in one transaction so a concurrent `replace_all()` is seen either
+        entirely or not at all.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN")
+            row = self._conn.execute(
+                "SELECT member_ids, last_active FROM guild_snapshots WHERE guild_id = ?", (self.guild_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT member_id, last_active FROM guild_activity WHERE guild_id = ?", (self.guild_id,)
+            ).fetchall()
+        activity = CompactActivity.from_bytes(*row) if row else CompactActivity()
+        for member_id, last_active in rows:
+            if last_active > (activity.timestamp(member_id) or 0.0):
+                activity[member_id] = last_active
+        return activity
+
+    def has_snapshot(self) -> bool:
+        """
+        Whether a finished scan was ever stored. Live updates alone are written
+        from the start, so `load()` can return members before the first scan
+        is complete.
+        """
+        row = self._conn.execute("SELECT 1 FROM guild_snapshots WHERE guild_id = ?", (self.guild_id,)).fetchone()
+        return row is not None
+
+    def record(self, member_id: int, last_active: datetime):
+        """Queue a live update; only the newest timestamp per member is kept."""
+        ts = last_active.timestamp()
+        if ts > self._pending.get(member_id, 0.0):
+            self._pending[member_id] = ts
+        if self.metrics:
+            self.metrics.inc("activity_updates_total")
+        if len(self._pending) >= self.max_pending:
+            try:
+                self.flush(reason="size")
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not write activity of guild {self.guild_id}, retrying on the next flush: {e}")
+
+    @property
+    def pending(self) -> int:
+        """Members with an update that isn't written yet."""
+        return len(self._pending)
+
+    def flush(self, reason: str = "timer") -> int:
+        """Write queued updates in one transaction. Returns the number of rows written."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        started = time.perf_counter()
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO guild_activity (guild_id, member_id, last_active) VALUES (?, ?, ?) "
+                    "ON CONFLICT(guild_id, member_id) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+                    ((self.guild_id, member_id, ts) for member_id, ts in batch.items()),
+                )
+        except sqlite3.Error:
+            # Keep the batch (and anything newer queued meanwhile) for the next flush
+            for member_id, ts in batch.items():
+                if ts > self._pending.get(member_id, 0.0):
+                    self._pending[member_id] = ts
+            if self.metrics:
+                self.metrics.inc("activity_flush_errors_total")
+            raise
+        if self.metrics:
+            elapsed = time.perf_counter() - started
+            self.metrics.inc("activity_flushes_total", reason=reason)
+            self.metrics.inc("activity_flushed_rows_total", len(batch))
+            self.metrics.set("activity_flush_last_seconds", elapsed)
+            self.metrics.set("activity_flush_max_seconds", max(elapsed, self.metrics.get("activity_flush_max_seconds")))
+        return len(batch)
+
+    def replace_all(self, activity: Mapping[int, datetime]):
+        """Swap the stored snapshot for a freshly scanned cache and drop the live updates it covers."""
+        self._pending.clear()
+        if not isinstance(activity, CompactActivity):
+            activity = CompactActivity.from_mapping(activity)
+        member_ids, last_active = activity.to_bytes()
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO guild_snapshots (guild_id, member_ids, last_active) VALUES (?, ?, ?)",
+                (self.guild_id, member_ids, last_active),
+            )
+            self._conn.execute("DELETE FROM guild_activity WHERE guild_id = ?", (self.guild_id,))
+
+    def load_watermarks(self) -> Dict[int, int]:
+        """Last scanned message ID per channel of this guild."""
+        rows = self._conn.execute(
+            "SELECT channel_id, message_id FROM channel_watermarks WHERE guild_id = ?", (self.guild_id,)
+        )
+        return dict(rows)
+
+    def save_watermarks(self, watermarks: Dict[int, int]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO channel_watermarks (guild_id, channel_id, message_id) VALUES (?, ?, ?)",
+                ((self.guild_id, channel_id, message_id) for channel_id, message_id in watermarks.items()),
+            )
+
+    def load_archive_marks(self) -> Dict[int, datetime]:
+        """When each parent channel's archived threads were last listed."""
+        rows = self._conn.execute(
+            "SELECT channel_id, listed_at FROM archive_marks WHERE guild_id = ?", (self.guild_id,)
+        )
+        return {channel_id: datetime.fromtimestamp(ts, timezone.utc) for channel_id, ts in rows}
+
+    def save_archive_marks(self, marks: Dict[int, datetime]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archive_marks (guild_id, channel_id, listed_at) VALUES (?, ?, ?)",
+                ((self.guild_id, channel_id, when.timestamp()) for channel_id, when in marks.items()),
+            )
+
+    def start_scan_checkpoint(self, since: datetime):
+        """Begin checkpointing a new scan, dropping what an older one left behind."""
+        with self._conn:
+            self._clear_scan_checkpoint()
+            self._conn.execute(
+                "INSERT INTO scan_runs (guild_id, since, started) VALUES (?, ?, ?)",
+                (self.guild_id, since.timestamp(), time.time()),
+            )
+
+    def load_scan_checkpoint(self) -> Optional[ScanCheckpoint]:
+        """The checkpoint of an interrupted scan, or None if the last scan finished."""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            run = self._conn.execute(
+                "SELECT since, started FROM scan_runs WHERE guild_id = ?", (self.guild_id,)
+            ).fetchone()
+            if run is None:
+                return None
+            channels = self._conn.execute(
+                "SELECT channel_id, after_id, newest_id, cursor_id, messages, done FROM scan_progress WHERE guild_id = ?",
+                (self.guild_id,),
+            ).fetchall()
+            authors = self._conn.execute(
+                "SELECT member_id, last_active FROM scan_activity WHERE guild_id = ?", (self.guild_id,)
+            ).fetchall()
+        return ScanCheckpoint(
+            since=datetime.fromtimestamp(run[0], timezone.utc),
+            started=datetime.fromtimestamp(run[1], timezone.utc),
+            channels={
+                channel_id: ChannelProgress(after_id, newest_id, cursor_id, messages, bool(done))
+                for channel_id, after_id, newest_id, cursor_id, messages, done in channels
+            },
+            activity={member_id: datetime.fromtimestamp(ts, timezone.utc) for member_id, ts in authors},
+        )
+
+    def save_channel_checkpoint(self, channel_id: int, progress: ChannelProgress, authors: Mapping[int, datetime]):
+        """
+        Store one channel's cursor together with the authors read up to it, in
+        one transaction so a resumed walk never skips or loses a message.
+        """
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scan_progress "
+                "(guild_id, channel_id, after_id, newest_id, cursor_id, messages, done) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.guild_id, channel_id, progress.after_id, progress.newest_id, progress.cursor_id,
+                 progress.messages, int(progress.done)),
+            )
+            self._conn.executemany(
+                "INSERT INTO scan_activity (guild_id, member_id, last_active) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id, member_id) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+                ((self.guild_id, member_id, when.timestamp()) for member_id, when in authors.items()),
+            )
+
+    def clear_scan_checkpoint(self):
+        with self._conn:
+            self._clear_scan_checkpoint()
+
+    def _clear_scan_checkpoint(self):
+        for table in ("scan_runs", "scan_progress", "scan_activity"):
+            self._conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (self.guild_id,))
+
+    def close(self):
+        self.flush(reason="shutdown")
+        if self._owns_conn:
+            self._conn.close()
@@ -0,0 +1,112 @@
+"""
+End-to-end benchmark of the bot against a simulated guild: drives
+refresh_activity_cache, a restart answering !lastactive from the persisted
+cache, inactivity_report, exportactivity, a dry run and
+check_inactive_members_function from bot.py and reports wall time, REST
+calls and peak Python memory for each stage.
+
+    python benchmarks/bench_bot.py --members 3000 --channels 30 --messages 3000 --latency 0.005
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_discord import FakeHttpBackend, attach_bot, build_guild, use_fake_bot_settings  # noqa: E402
+
+use_fake_bot_settings()
+import bot as cleaner_bot  # noqa: E402
+
+
+class FakeContext:
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.message = None
+        self.replies = []
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api("POST /channels/commands/messages")
+        self.replies.append((content, kwargs))
+
+
+async def run_stage(name, guild, coro_factory, quiet=True):
+    calls_before = guild.api_calls
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        await coro_factory()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<18} wall={elapsed:8.3f}s  api_calls={guild.api_calls - calls_before:>7}  peak_mem={peak / 1024 / 1024:7.1f} MiB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=3000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000, help="messages per channel")
+    parser.add_argument("--days", type=int, default=365, help="history spread, in days")
+    parser.add_argument("--skew", type=float, default=1.0, help="author Zipf exponent")
+    parser.add_argument("--cleaners", type=float, default=0.1, help="share of members with the Cleaner role")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per REST call (0 = no HTTP simulation)")
+    parser.add_argument("--route-limit", type=int, default=5)
+    parser.add_argument("--global-limit", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    args = parser.parse_args()
+
+    guild = build_guild(
+        members=args.members, channels=args.channels, messages_per_channel=args.messages,
+        days=args.days, skew=args.skew,
+    )
+    state = await attach_bot(cleaner_bot, guild, cleaner_ratio=args.cleaners)
+    state.role_index.rebuild(guild.members)
+    if args.latency:
+        guild.http = FakeHttpBackend(
+            latency=args.latency, route_limit=args.route_limit, global_limit=args.global_limit,
+        )
+
+    ctx = FakeContext(guild, guild.me)
+    quiet = not args.verbose
+
+    print(
+        f"guild: {args.members} members, {args.channels} channels x {args.messages} messages, "
+        f"latency={args.latency}s"
+    )
+    await run_stage("refresh (full)", guild, lambda: cleaner_bot.refresh_activity_cache(state, guild), quiet)
+    await run_stage("refresh (incr.)", guild, lambda: cleaner_bot.refresh_activity_cache(state, guild), quiet)
+
+    # A restart with lazy member loading: the persisted cache answers !lastactive before the
+    # member list is loaded, and the first command that needs every member loads it
+    member = next(m for m in guild.members if not m.bot)
+
+    async def restart_then_lastactive():
+        restarted = cleaner_bot.GuildState(state.config, ":memory:", cleaner_bot.activity_db)
+        cleaner_bot.guild_states[guild.id] = restarted
+        cleaner_bot.load_persisted_activity(restarted)
+        await cleaner_bot.lastactive.callback(ctx, [member])
+
+    guild.chunked = False
+    await run_stage("restart+lastactive", guild, restart_then_lastactive, quiet)
+    cleaner_bot.guild_states[guild.id] = state
+    chunked_before = guild.chunk_requests
+    await run_stage("inactivity_report", guild, lambda: cleaner_bot.inactivity_report.callback(ctx), quiet)
+    print(f"member list loaded by: {'inactivity_report' if guild.chunk_requests > chunked_before else 'startup'}")
+    await run_stage("exportactivity", guild, lambda: cleaner_bot.exportactivity.callback(ctx), quiet)
+    await run_stage("dry run", guild, lambda: cleaner_bot.run_inactivity_check.callback(ctx, "dry"), quiet)
+    await run_stage("inactivity check", guild, lambda: cleaner_bot.check_inactive_members_function(state), quiet)
+
+    phases = ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in state.metrics.phases.items())
+    print(f"check phases: {phases}")
+    print(f"messages sent: {len(guild.sent)}, members left: {len(guild.members)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Measures scan throughput at different concurrency levels against a fake
+guild whose REST layer applies latency, per-route buckets and a global limit.
+
+    python benchmarks/bench_concurrency.py --channels 20 --messages 1000 --levels 1 2 4 8
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_discord import FakeHttpBackend, build_guild  # noqa: E402
+from scanner import RequestPacer, scan_channels  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000, help="messages per channel")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per REST call")
+    parser.add_argument("--route-limit", type=int, default=5, help="calls per route per second")
+    parser.add_argument("--global-limit", type=int, default=50, help="calls per second across all routes")
+    parser.add_argument("--rate", type=float, default=40, help="pacer requests per second (0 disables)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    guild = build_guild(members=args.members, channels=args.channels, messages_per_channel=args.messages)
+    reference = None
+
+    for level in args.levels:
+        guild.history_pages = 0
+        guild.http = FakeHttpBackend(
+            latency=args.latency,
+            route_limit=args.route_limit,
+            global_limit=args.global_limit,
+        )
+        pacer = RequestPacer(args.rate) if args.rate else None
+
+        started = time.perf_counter()
+        latest = await scan_channels(guild, None, concurrency=level, pacer=pacer)
+        elapsed = time.perf_counter() - started
+
+        if reference is None:
+            reference = latest
+        elif latest != reference:
+            print(f"❌ concurrency={level} produced a different result")
+            sys.exit(1)
+
+        print(
+            f"concurrency={level:<3} wall={elapsed:7.2f}s  requests={guild.http.requests:>5}  "
+            f"req/s={guild.http.requests / elapsed:6.1f}  429s={guild.http.rate_limited:>4}  "
+            f"pacer_wait={pacer.waited if pacer else 0:6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
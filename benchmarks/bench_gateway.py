@@ -0,0 +1,220 @@
+"""
+Load test for the gateway event path: a fake gateway replays a synthetic
+message stream at fixed rates through bot.py's on_message (activity
+tracking, then bot.process_commands), dispatching every event as its own
+task the way discord.py does. For each rate it measures event-loop lag,
+handler latency percentiles (from when the message was due to arrive) and
+memory growth, once on an otherwise idle loop and once while
+refresh_activity_cache runs a full, paced scan on the same loop.
+
+    python benchmarks/bench_gateway.py --rates 200 1000 5000 --seconds 10
+
+Memory is measured with tracemalloc, which slows every handler down; pass
+--no-memory for latency figures closer to production.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+from discord.utils import time_snowflake
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_discord import (  # noqa: E402
+    FakeHttpBackend, FakeMember, FakeMessage, attach_bot, build_guild, use_fake_bot_settings,
+)
+
+use_fake_bot_settings()
+import bot as cleaner_bot  # noqa: E402
+from compact_activity import CompactActivity  # noqa: E402
+
+LAG_PROBE_SECONDS = 0.01
+
+
+class FakeGateway:
+    """Delivers messages at a fixed rate; each one is handled in its own task, as discord.py dispatches events."""
+
+    def __init__(self, handler: Callable[[FakeMessage], Awaitable[None]], rate: float, make_message: Callable[[], FakeMessage]):
+        self.handler = handler
+        self.rate = rate
+        self.make_message = make_message
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._tasks = set()
+
+    async def _deliver(self, message: FakeMessage, due: float):
+        try:
+            await self.handler(message)
+        except Exception:
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - due)
+
+    async def run(self, seconds: float) -> int:
+        started = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - started < seconds:
+            # Everything that would have arrived by now is delivered, even if the loop was blocked
+            elapsed = time.perf_counter() - started
+            while sent <= elapsed * self.rate:
+                task = asyncio.create_task(self._deliver(self.make_message(), started + sent / self.rate))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                sent += 1
+            await asyncio.sleep(0.001)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        return sent
+
+
+async def probe_loop_lag(samples: List[float]):
+    """How much later than asked a short sleep wakes up; a blocked loop delays heartbeats the same way."""
+    while True:
+        expected = time.perf_counter() + LAG_PROBE_SECONDS
+        await asyncio.sleep(LAG_PROBE_SECONDS)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def message_factory(guild, staff: FakeMember, command: str, command_share: float, seed: int = 7):
+    rng = random.Random(seed)
+    humans = [m for m in guild.members if not m.bot]
+    channels = guild.text_channels
+    counter = 0
+
+    def make_message() -> FakeMessage:
+        nonlocal counter
+        counter += 1
+        now = datetime.now(timezone.utc)
+        is_command = rng.random() < command_share
+        return FakeMessage(
+            id=time_snowflake(now) + counter % 4096,
+            author=staff if is_command else rng.choice(humans),
+            created_at=now,
+            content=command if is_command else "just chatting",
+            guild=guild,
+            channel=rng.choice(channels),
+        )
+    return make_message
+
+
+async def run_scenario(label: str, rate: float, seconds: float, make_message, memory: bool, scan=None) -> str:
+    """Stream messages for `seconds` (optionally next to a scan) and return one result row."""
+    lag: List[float] = []
+    probe = asyncio.create_task(probe_loop_lag(lag))
+    if memory:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0] if memory else 0
+    scan_task: Optional[asyncio.Task] = asyncio.create_task(scan()) if scan else None
+    scan_started = time.perf_counter()
+
+    gateway = FakeGateway(cleaner_bot.on_message, rate, make_message)
+    started = time.perf_counter()
+    sent = await gateway.run(seconds)
+    elapsed = time.perf_counter() - started
+    probe.cancel()
+
+    scan_note = ""
+    if scan_task:
+        if scan_task.done():
+            scan_note = f"  scan done in {scan_task.result() or time.perf_counter() - scan_started:.1f}s"
+        else:
+            scan_note = "  scan still running"
+            scan_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await scan_task
+    memory_note = ""
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory_note = f"  mem +{(current - before) / 1024 / 1024:5.1f} MiB (peak {peak / 1024 / 1024:5.1f})"
+
+    ms = [latency * 1000 for latency in gateway.latencies]
+    return (
+        f"{label:<9} rate={rate:>6.0f}/s  handled={sent / elapsed:>7.0f}/s  "
+        f"latency p50={percentile(ms, 0.5):6.2f} p95={percentile(ms, 0.95):7.2f} "
+        f"p99={percentile(ms, 0.99):7.2f} max={max(ms, default=0):7.1f} ms  "
+        f"loop lag p99={percentile(lag, 0.99) * 1000:6.1f} max={max(lag, default=0) * 1000:6.1f} ms"
+        f"{memory_note}{scan_note}"
+        + (f"  errors={gateway.errors}" if gateway.errors else "")
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=float, nargs="+", default=[200, 1000, 5000], help="messages per second")
+    parser.add_argument("--seconds", type=float, default=10, help="length of each stream")
+    parser.add_argument("--members", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=2000, help="history messages per channel, for the scan")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per REST call during the scan")
+    parser.add_argument("--command-share", type=float, default=0.001, help="share of messages that are commands")
+    parser.add_argument("--command", default="!inactive_between 60 90", help="command the staff member sends")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    args = parser.parse_args()
+
+    guild = build_guild(members=args.members, channels=args.channels, messages_per_channel=args.messages)
+    state = await attach_bot(cleaner_bot, guild)
+    staff = FakeMember(
+        id=80_000_000, display_name="staff", joined_at=datetime.now(timezone.utc),
+        roles=[guild.default_role, guild.get_role(cleaner_bot.GENERAL_ROLE_ID)], guild=guild,
+    )
+    guild.members.append(staff)
+    state.role_index.rebuild(guild.members)
+    def quiet():
+        return contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    with quiet():
+        await cleaner_bot.refresh_activity_cache(state, guild)
+    guild.http = FakeHttpBackend(latency=args.latency)
+
+    print(
+        f"guild: {args.members} members, {args.channels} channels x {args.messages} messages; "
+        f"{args.seconds:.0f}s per stream, {args.command_share:.2%} `{args.command}`"
+    )
+    make_message = message_factory(guild, staff, args.command, args.command_share)
+    for rate in args.rates:
+        with quiet():
+            row = await run_scenario("idle", rate, args.seconds, make_message, not args.no_memory)
+        print(row)
+
+        # A fresh store without watermarks makes the refresh a full scan, while commands keep
+        # answering from a copy of the current cache
+        scanning = cleaner_bot.GuildState(state.config, ":memory:")
+        scanning.activity = CompactActivity.from_mapping(state.activity)
+        scanning.ready = True
+        scanning.role_index.rebuild(guild.members)
+        cleaner_bot.guild_states[guild.id] = scanning
+
+        async def scan():
+            started = time.perf_counter()
+            await cleaner_bot.refresh_activity_cache(scanning, guild)
+            return time.perf_counter() - started
+
+        with quiet():
+            row = await run_scenario("scanning", rate, args.seconds, make_message, not args.no_memory, scan)
+        print(row)
+        cleaner_bot.guild_states[guild.id] = state
+        scanning.store.close()
+
+        # Sends and live activity accumulate in the fakes and the store buffer; start each rate clean
+        guild.sent.clear()
+        state.store.flush()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""
+Compares the legacy per-member history scan with the single-pass scanner
+against a fake guild and reports how many history pages each one fetches.
+It then adds a day of traffic and measures an incremental (watermarked)
+rescan and the resume of a scan interrupted before that traffic against a
+fresh full scan, and finally a time-bounded scan with and without early
+stopping.
+
+    python benchmarks/bench_scan.py --members 300 --channels 10 --messages 2000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_discord import add_traffic, build_guild  # noqa: E402
+from scanner import apply_join_defaults, scan_channels  # noqa: E402
+
+MAX_MESSAGE_LOOKBACK = 5000
+
+
+async def legacy_last_activity(member, guild, limit):
+    """The original get_last_activity: re-reads every channel for one member."""
+    latest_msg_time = member.joined_at or datetime(1970, 1, 1, tzinfo=timezone.utc)
+    for channel in guild.text_channels:
+        if not channel.permissions_for(guild.me).read_messages:
+            continue
+        if channel.last_message_id is None:
+            continue
+        async for msg in channel.history(limit=limit):
+            if msg.author.id == member.id:
+                latest_msg_time = max(latest_msg_time, msg.created_at)
+    return latest_msg_time
+
+
+async def scan_guild_activity(guild, limit):
+    """Single-pass scan: every channel is read once and all authors are folded in."""
+    latest = await scan_channels(guild, limit)
+    return apply_join_defaults(latest, guild.members)
+
+
+async def legacy_scan(guild, limit):
+    cache = {}
+    for member in [m for m in guild.members if not m.bot]:
+        cache[member.id] = await legacy_last_activity(member, guild, limit)
+    return cache
+
+
+async def measure(label, scan, guild, limit):
+    guild.history_pages = 0
+    started = time.perf_counter()
+    result = await scan(guild, limit)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} pages={guild.history_pages:>9}  wall={elapsed:8.3f}s  members={len(result)}")
+    return result, guild.history_pages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=2000, help="messages per channel")
+    parser.add_argument("--daily", type=int, default=200, help="new messages per channel before the rescan")
+    parser.add_argument("--limit", type=int, default=MAX_MESSAGE_LOOKBACK)
+    parser.add_argument("--since-days", type=int, default=180, help="lookback of the time-bounded scan")
+    args = parser.parse_args()
+
+    guild = build_guild(members=args.members, channels=args.channels, messages_per_channel=args.messages)
+
+    legacy, legacy_pages = await measure("per-member", legacy_scan, guild, args.limit)
+    single, single_pages = await measure("single-pass", scan_guild_activity, guild, args.limit)
+
+    if legacy != single:
+        mismatched = [k for k in legacy if legacy[k] != single.get(k)]
+        print(f"❌ Results differ for {len(mismatched)} members")
+        sys.exit(1)
+
+    print(f"✅ Identical results, {legacy_pages / max(single_pages, 1):.0f}x fewer history pages")
+
+    # Seed watermarks with a full scan, then rescan after a day of traffic. The first checkpoint
+    # of every channel (mid-walk for long ones, done for short ones) stands in for a scan that
+    # was interrupted before that traffic came in
+    watermarks = {}
+    checkpoints, checkpointed = {}, {}
+
+    def keep_first_checkpoint(channel, progress, authors):
+        if channel.id not in checkpoints:
+            checkpoints[channel.id] = replace(progress)
+            for member_id, when in authors.items():
+                checkpointed[member_id] = max(when, checkpointed.get(member_id, when))
+
+    latest = await scan_channels(guild, args.limit, watermarks, on_checkpoint=keep_first_checkpoint)
+    baseline = apply_join_defaults(latest, guild.members)
+    add_traffic(guild, args.daily)
+
+    async def incremental_scan(guild, limit):
+        latest = await scan_channels(guild, limit, watermarks)
+        return apply_join_defaults(latest, guild.members, previous=baseline)
+
+    merged, incremental_pages = await measure("incremental", incremental_scan, guild, args.limit)
+    fresh, full_pages = await measure("full rescan", scan_guild_activity, guild, args.limit)
+
+    if merged != fresh:
+        print("❌ Incremental merge differs from a full rescan")
+        sys.exit(1)
+
+    print(f"✅ Incremental rescan matches, {full_pages / max(incremental_pages, 1):.0f}x fewer history pages")
+
+    async def resumed_scan(guild, limit):
+        latest = await scan_channels(guild, limit, resume=checkpoints, resumed_activity=checkpointed)
+        return apply_join_defaults(latest, guild.members)
+
+    unfinished = sum(not progress.done for progress in checkpoints.values())
+    resumed, _ = await measure("resumed", resumed_scan, guild, args.limit)
+    if resumed != fresh:
+        print("❌ Resumed scan missed messages posted after its checkpoints")
+        sys.exit(1)
+
+    print(f"✅ Resumed scan matches ({unfinished}/{len(checkpoints)} channels resumed mid-walk)")
+
+    # Time-bounded lookback, with early stopping against what the previous snapshot already knows
+    since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+    previous = apply_join_defaults({}, guild.members, previous=fresh)
+
+    async def bounded_scan(guild, limit):
+        return apply_join_defaults(await scan_channels(guild, None, since=since), guild.members, previous=fresh)
+
+    async def early_stop_scan(guild, limit):
+        latest = await scan_channels(guild, None, since=since, baseline=previous)
+        return apply_join_defaults(latest, guild.members, previous=fresh)
+
+    bounded, bounded_pages = await measure("time-bound", bounded_scan, guild, None)
+    stopped, stopped_pages = await measure("early-stop", early_stop_scan, guild, None)
+
+    if bounded != stopped:
+        print("❌ Early stopping changed the result")
+        sys.exit(1)
+
+    print(f"✅ Time-bounded scans match, {full_pages / max(stopped_pages, 1):.1f}x fewer history pages than a full rescan")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Compares the activity cache as a plain `Dict[int, datetime]` with
+`CompactActivity`: memory held, lookup, threshold bucketing, splitting
+members into inactivity bands and "last active between X and Y days ago"
+query time, and the cost of persisting and reloading it through
+`ActivityStore`.
+
+    python benchmarks/bench_store.py --members 100000
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from activity_store import ActivityStore  # noqa: E402
+from compact_activity import CompactActivity  # noqa: E402
+
+
+def measure(build):
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"  {label:<22} {time.perf_counter() - started:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365, help="activity spread, in days")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    now_ts = now.timestamp()
+    pairs = [
+        (rng.getrandbits(63), now_ts - rng.random() * args.days * 86400)
+        for _ in range(args.members)
+    ]
+    member_ids = [member_id for member_id, _ in pairs]
+    thresholds = (90, 180)
+
+    plain, plain_size = measure(lambda: {
+        member_id: datetime.fromtimestamp(ts, timezone.utc) for member_id, ts in pairs
+    })
+    compact, compact_size = measure(lambda: CompactActivity.from_mapping(dict(pairs)))
+    print(f"{args.members} members")
+    print(f"  dict memory            {plain_size / 1024 / 1024:8.1f} MiB")
+    print(f"  compact memory         {compact_size / 1024 / 1024:8.1f} MiB")
+
+    print("dict:")
+    timed("lookup + days", lambda: [(now - plain[member_id]).days for member_id in member_ids])
+
+    def dict_buckets():
+        counts = [0, 0, 0]
+        for last_active in plain.values():
+            days = (now - last_active).days
+            counts[sum(days >= limit for limit in thresholds)] += 1
+        return counts
+    expected = timed("bucket counts", dict_buckets)
+
+    print("compact:")
+    timed("lookup + days", lambda: [int((now_ts - compact.timestamp(member_id)) // 86400) for member_id in member_ids])
+    counts = timed("bucket counts", lambda: compact.bucket_counts(now_ts, thresholds))
+    timed("bucket counts (cached)", lambda: compact.bucket_counts(now_ts, thresholds))
+    assert counts == expected, (counts, expected)
+    # Reports and checks take members band by band instead of looking each one up
+    cutoffs = [now_ts - days * 86400 for days in sorted(thresholds, reverse=True)]
+    bands = timed("split into bands", lambda: compact.split(cutoffs))
+    assert [len(ids) for ids, _ in reversed(bands)] == expected
+
+    print("range query (60-90 days ago):")
+    expected_range = timed("dict scan + sort", lambda: sorted(
+        (member_id for member_id, last_active in plain.items() if 60 <= (now - last_active).days <= 90),
+        key=plain.__getitem__,
+    ))
+    found = timed("compact index", lambda: compact.inactive_between(now_ts, 60, 90))
+    assert {member_id for member_id, _ in found} == set(expected_range)
+    # Live activity moves members without rebuilding the index
+    for member_id in rng.sample(member_ids, min(1000, len(member_ids))):
+        compact[member_id] = now_ts - rng.random() * args.days * 86400
+    timed("after 1000 writes", lambda: compact.inactive_between(now_ts, 60, 90))
+
+    store = ActivityStore(":memory:", guild_id=1)
+    print("persist:")
+    timed("replace_all", lambda: store.replace_all(compact))
+    loaded = timed("load", store.load)
+    assert loaded.to_bytes() == compact.to_bytes()
+    store.close()
+    print(f"bands <90d / 90-180d / >=180d: {counts}")
+
+
+if __name__ == "__main__":
+    main()
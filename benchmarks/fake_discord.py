@@ -0,0 +1,370 @@
+"""
+Minimal in-memory stand-ins for the parts of discord.py the bot touches,
+so scans, reports and checks can be measured offline. Every history page
+(100 messages, the same page size Discord's REST API uses) and every other
+REST call (sends, role edits, kicks) is counted on the guild, and goes
+through the optional FakeHttpBackend for latency and rate limits.
+"""
+import asyncio
+import os
+import random
+import tempfile
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from discord.ext import commands
+from discord.utils import time_snowflake
+
+PAGE_SIZE = 100
+
+
+@dataclass
+class FakePermissions:
+    read_messages: bool = True
+    read_message_history: bool = True
+
+
+@dataclass(eq=False)
+class FakeRole:
+    id: int
+    name: str
+
+
+@dataclass(eq=False)
+class FakeMember:
+    id: int
+    display_name: str
+    joined_at: Optional[datetime]
+    bot: bool = False
+    roles: List[FakeRole] = field(default_factory=list)
+    guild: Optional["FakeGuild"] = field(default=None, repr=False)
+
+    @property
+    def name(self):
+        return self.display_name
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    async def edit(self, *, roles=None, reason=None):
+        await self.guild.api(f"PATCH /guilds/{self.guild.id}/members")
+        if roles is not None:
+            self.roles = [self.guild.default_role, *roles]
+
+    async def kick(self, *, reason=None):
+        await self.guild.api(f"DELETE /guilds/{self.guild.id}/members")
+        self.guild.members.remove(self)
+
+
+@dataclass
+class FakeMessage:
+    id: int
+    author: FakeMember
+    created_at: datetime
+    content: str = ""
+    guild: Optional["FakeGuild"] = field(default=None, repr=False)
+    channel: Optional["FakeTextChannel"] = field(default=None, repr=False)
+    attachments: List[object] = field(default_factory=list, repr=False)
+    _state: object = field(default=None, repr=False)  # commands.Context keeps it; nothing reads it here
+
+
+class FakeHttpBackend:
+    """
+    Simulated Discord REST layer: every call costs `latency` seconds, each
+    route has its own bucket and all routes share a global limit.
+
+    Per-route exhaustion is waited out without an error, the way discord.py
+    does from the X-RateLimit-Remaining/Reset headers. Going over the global
+    limit is only discovered by the 429 response, so those are counted and
+    retried after `retry_after`, again like discord.py.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        route_limit: int = 5,
+        route_window: float = 1.0,
+        global_limit: int = 50,
+        global_window: float = 1.0,
+    ):
+        self.latency = latency
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_limit = global_limit
+        self.global_window = global_window
+        self.requests = 0
+        self.rate_limited = 0  # 429 responses
+        self.waited = 0.0  # seconds spent in per-route or 429 waits
+        self._routes = defaultdict(deque)
+        self._global = deque()
+
+    @staticmethod
+    def _prune(calls: deque, now: float, window: float):
+        while calls and now - calls[0] >= window:
+            calls.popleft()
+
+    async def request(self, route: str):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            calls = self._routes[route]
+            self._prune(calls, now, self.route_window)
+            self._prune(self._global, now, self.global_window)
+
+            if len(calls) >= self.route_limit:
+                delay = self.route_window - (now - calls[0])
+            elif len(self._global) >= self.global_limit:
+                self.rate_limited += 1
+                delay = self.global_window - (now - self._global[0])
+            else:
+                break
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+        calls.append(now)
+        self._global.append(now)
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+
+def _snowflake(value, high: bool) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return time_snowflake(value, high=high)
+    return getattr(value, "id", value)
+
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id: int, name: str, readable: bool = True):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.readable = readable
+        self.messages: List[FakeMessage] = []  # oldest first
+        self.archived: List["FakeTextChannel"] = []  # archived threads, newest archive first
+        self.archive_timestamp: Optional[datetime] = None  # set on archived threads
+
+    @property
+    def last_message_id(self):
+        return self.messages[-1].id if self.messages else None
+
+    def permissions_for(self, _member):
+        return FakePermissions(read_messages=self.readable, read_message_history=self.readable)
+
+    async def archived_threads(self, *, private=False, joined=False, limit=100, before=None):
+        await self.guild.api(f"GET /channels/{self.id}/threads/archived/public")
+        for thread in self.archived:
+            yield thread
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api(f"POST /channels/{self.id}/messages")
+        self.guild.sent.append((self.id, content, kwargs))
+
+    async def history(self, *, limit=100, before=None, after=None, around=None, oldest_first=None):
+        before_id = _snowflake(before, high=False)
+        after_id = _snowflake(after, high=True)
+        if oldest_first is None:
+            oldest_first = after is not None
+
+        selected = [
+            m for m in self.messages
+            if (before_id is None or m.id < before_id) and (after_id is None or m.id > after_id)
+        ]
+        if not oldest_first:
+            selected.reverse()
+        if limit is not None:
+            selected = selected[:limit]
+
+        # One REST call per page, including the empty page that ends the walk.
+        for start in range(0, max(len(selected), 1), PAGE_SIZE):
+            self.guild.history_pages += 1
+            await self.guild.api(f"GET /channels/{self.id}/messages")
+            for msg in selected[start:start + PAGE_SIZE]:
+                yield msg
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+        self.members: List[FakeMember] = []
+        self.text_channels: List[FakeTextChannel] = []
+        self.voice_channels = []
+        self.stage_channels = []
+        self.forums = []
+        self.threads = []  # active threads
+        self.channels = {}  # every channel by ID, including ones that are never scanned
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.roles = {guild_id: self.default_role}
+        self.me = FakeMember(id=0, display_name="bot", joined_at=None, bot=True, guild=self)
+        self.filesize_limit = 10 * 1024 * 1024
+        self.history_pages = 0
+        self.api_calls = 0  # every REST call, history pages included
+        self.sent = []  # (channel_id, content, kwargs) of every message sent
+        self.http: Optional[FakeHttpBackend] = None
+        self._by_id = {}
+        self.chunked = True  # set to False to simulate a bot that hasn't loaded the member list yet
+        self.chunk_requests = 0
+
+    async def chunk(self, *, cache=True):
+        """Member list request over the gateway; one chunk per 1000 members."""
+        self.chunk_requests += 1
+        for _ in range(0, max(len(self.members), 1), 1000):
+            if self.http:
+                await asyncio.sleep(self.http.latency)
+        self.chunked = True
+        return self.members
+
+    async def api(self, route: str):
+        self.api_calls += 1
+        if self.http:
+            await self.http.request(route)
+
+    def get_member(self, member_id: int):
+        # Rebuilt when members were added or kicked, so lookups stay O(1) like the gateway cache
+        if len(self._by_id) != len(self.members):
+            self._by_id = {member.id: member for member in self.members}
+        return self._by_id.get(member_id)
+
+    def get_role(self, role_id: int):
+        return self.roles.get(role_id)
+
+    def add_role(self, role_id: int, name: str) -> FakeRole:
+        self.roles[role_id] = FakeRole(role_id, name)
+        return self.roles[role_id]
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def add_channel(self, channel_id: int, name: str) -> FakeTextChannel:
+        """A channel the bot posts to but doesn't scan (warning/staff channels)."""
+        channel = FakeTextChannel(self, channel_id, name)
+        self.channels[channel_id] = channel
+        return channel
+
+
+def build_guild(
+    members: int = 300,
+    channels: int = 10,
+    messages_per_channel: int = 2000,
+    bots: int = 5,
+    days: int = 365,
+    seed: int = 1234,
+    skew: float = 1.0,
+) -> FakeGuild:
+    """
+    Generate a guild whose message authors follow a long-tailed distribution:
+    a few members write most messages, many write rarely or never. `skew` is
+    the Zipf exponent (0 = every member equally chatty).
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    guild = FakeGuild()
+
+    for index in range(members):
+        joined = now - timedelta(days=rng.randint(1, days * 2))
+        guild.members.append(FakeMember(
+            id=10_000_000 + index, display_name=f"member{index}", joined_at=joined,
+            roles=[guild.default_role], guild=guild,
+        ))
+    for index in range(bots):
+        guild.members.append(FakeMember(
+            id=90_000_000 + index, display_name=f"bot{index}", joined_at=now, bot=True,
+            roles=[guild.default_role], guild=guild,
+        ))
+
+    weights = [1 / (rank + 1) ** skew for rank in range(len(guild.members))]
+    for index in range(channels):
+        channel = FakeTextChannel(guild, channel_id=500 + index, name=f"channel-{index}")
+        authors = rng.choices(guild.members, weights=weights, k=messages_per_channel)
+        stamps = sorted(now - timedelta(seconds=rng.randint(0, days * 86400)) for _ in authors)
+        for author, created_at in zip(authors, stamps):
+            msg_id = time_snowflake(created_at) + rng.randint(0, 4095)
+            channel.messages.append(FakeMessage(id=msg_id, author=author, created_at=created_at))
+        channel.messages.sort(key=lambda m: m.id)
+        guild.text_channels.append(channel)
+        guild.channels[channel.id] = channel
+
+    return guild
+
+
+def assign_roles(
+    guild: FakeGuild,
+    cleaner_role_id: int,
+    soldier_role_id: int,
+    exempt_role_ids: List[int],
+    cleaner_ratio: float = 0.1,
+    exempt_ratio: float = 0.02,
+    extra_roles: int = 3,
+    seed: int = 99,
+):
+    """Hand out Cleaner, exempt and a few ordinary roles to the human members."""
+    rng = random.Random(seed)
+    cleaner = guild.add_role(cleaner_role_id, "Cleaner")
+    guild.add_role(soldier_role_id, "Soldier")
+    exempt = [guild.add_role(role_id, f"Exempt {role_id}") for role_id in exempt_role_ids]
+    ordinary = [guild.add_role(700 + index, f"Role {index}") for index in range(extra_roles)]
+
+    for member in guild.members:
+        if member.bot:
+            continue
+        roll = rng.random()
+        if roll < exempt_ratio:
+            member.roles.append(rng.choice(exempt))
+        elif roll < exempt_ratio + cleaner_ratio:
+            member.roles.append(cleaner)
+        else:
+            member.roles.extend(rng.sample(ordinary, rng.randint(0, len(ordinary))))
+
+
+def add_traffic(guild: FakeGuild, messages_per_channel: int, hours: int = 24, seed: int = 4321):
+    """Append fresh messages to every channel, e.g. one day of traffic since the last scan."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    humans = [m for m in guild.members if not m.bot]
+    for channel in guild.text_channels:
+        for _ in range(messages_per_channel):
+            created_at = now - timedelta(seconds=rng.randint(0, hours * 3600))
+            msg_id = max(time_snowflake(created_at), (channel.last_message_id or 0) + 1)
+            channel.messages.append(FakeMessage(id=msg_id, author=rng.choice(humans), created_at=created_at))
+        channel.messages.sort(key=lambda m: m.id)
+
+
+def use_fake_bot_settings():
+    """
+    Settings bot.py reads at import time, so call this before importing it:
+    only the DISCORD_GUILD_ID default config (a config file that doesn't
+    exist) and an in-memory store. Nothing connects to Discord.
+    """
+    os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+    os.environ["DISCORD_GUILD_ID"] = "1"
+    os.environ["ACTIVITY_DB_PATH"] = ":memory:"
+    os.environ["GUILD_CONFIG_PATH"] = os.path.join(tempfile.mkdtemp(), "guilds.json")
+
+
+async def attach_bot(cleaner_bot, guild: FakeGuild, cleaner_ratio: float = 0.1):
+    """
+    Give the guild the roles and channels of bot.py's default config and
+    point the imported `bot` module at it instead of the gateway cache.
+    process_commands needs to know which user the bot is and dispatches
+    command events on the bot's loop (what login() would set up), and
+    replies go to the fake channel instead of Discord's REST API. Returns
+    the guild's state; its role index is left to the caller to build.
+    """
+    assign_roles(
+        guild, cleaner_bot.CLEANER_ROLE_ID, cleaner_bot.SOLDIER_ROLE_ID, cleaner_bot.EXEMPT_ROLE_IDS,
+        cleaner_ratio=cleaner_ratio,
+    )
+    guild.add_channel(cleaner_bot.WARNING_CHANNEL_ID, "warnings")
+    guild.add_channel(cleaner_bot.STAFF_CHANNEL_ID, "staff")
+
+    await cleaner_bot.bot._async_setup_hook()
+    cleaner_bot.bot.get_guild = lambda guild_id: guild
+    cleaner_bot.bot.get_channel = guild.get_channel
+    cleaner_bot.bot._connection.user = guild.me
+    commands.Context.send = lambda ctx, *args, **kwargs: ctx.channel.send(*args, **kwargs)
+    return cleaner_bot.guild_states[guild.id]
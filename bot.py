@@ -1,21 +1,38 @@
 import os
+import signal
+import sqlite3
+import time
 import discord
-import csv
 import asyncio
 from discord.ext import tasks, commands
+from dataclasses import replace
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from typing import Dict, Tuple
-from io import StringIO
-from asyncio import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from scanner import ChannelProgress, RequestPacer, apply_join_defaults, fold_voice_members, scan_channels
+from compact_activity import DAY, CompactActivity
+from notifications import EMBED_DESCRIPTION_LIMIT, DigestBatcher, paginate_lines
+from report import ReportPaginator, build_report, report_pages
+from plan_review import PlanApprovalView, plan_diff_pages
+from metrics import dump_prometheus
+from export import activity_rows, gzip_csv_parts
+from actions import (
+    DEMOTE, KICK, RESTORE, PlannedAction, execute_actions, member_deadline, plan_inactivity_actions, plan_member_action,
+)
+from activity_store import connect
+from guilds import GuildConfig, GuildState, load_guild_configs, save_guild_config, shard_of
+from scheduler import CheckScheduler
+
+STARTED_AT = time.monotonic()  # for the startup latency metrics
 
-inactivity_check_lock = Lock()
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN")
-GUILD_ID = int(os.getenv("DISCORD_GUILD_ID"))
+# Optional: the guild of a single-guild setup, configured with the IDs below
+GUILD_ID = int(os.getenv("DISCORD_GUILD_ID", "0"))
+GUILD_CONFIG_PATH = os.getenv("GUILD_CONFIG_PATH", "guilds.json")
 
-# IDs
+# IDs of the DISCORD_GUILD_ID guild, used until it has an entry in GUILD_CONFIG_PATH
 CLEANER_ROLE_ID = 1225867465259618396
 SOLDIER_ROLE_ID = 1109506946689671199
 EXEMPT_ROLE_IDS = [1109510121454837822, 1269752542515040477]
@@ -23,79 +40,280 @@ WARNING_CHANNEL_ID = 1109096955252068384
 GENERAL_ROLE_ID = 1269752542515040477  
 STAFF_CHANNEL_ID = 1194194222702661632 
 
-# Constants
+# Constants (defaults for new guild configs)
 INACTIVITY_THRESHOLD = 90
 KICK_THRESHOLD = 180
-MAX_MESSAGE_LOOKBACK = 5000
+# Thresholds are acted on per member as they're crossed; the full check (rescan plus every
+# member) only reconciles what events missed, e.g. while the bot was offline
+CHECK_INTERVAL = timedelta(days=7)
+ACTIVITY_DB_PATH = os.getenv("ACTIVITY_DB_PATH", "activity.db")
+ACTIVITY_FLUSH_SECONDS = 30
+ACTIVITY_FLUSH_MAX_PENDING = 5000  # members with unwritten activity before a guild's buffer is flushed early
+SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", "4"))  # channels fetched in parallel
+SCAN_REQUESTS_PER_SECOND = 40  # stays below Discord's global limit of 50/s
+MODERATION_CONCURRENCY = 5  # members whose roles/kick are updated in parallel
+PLAN_APPROVAL_SECONDS = 15 * 60  # how long a dry-run plan can be approved
+SCAN_CHECKPOINT_MAX_AGE = timedelta(hours=24)  # older checkpoints of an interrupted scan are dropped, not resumed
+METRICS_FILE = os.getenv("METRICS_FILE")  # optional Prometheus textfile dump
+# Count coming online as activity; needs the privileged Presence intent in the developer portal
+TRACK_PRESENCE = os.getenv("TRACK_PRESENCE", "").lower() in ("1", "true", "yes")
+# Sharding: SHARD_COUNT alone runs every shard in this process; with SHARD_IDS (e.g. "0,1")
+# this process only runs those shards, and other processes run the rest (see launcher.py)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()] or None
 
 intents = discord.Intents.default()
 intents.members = True
 intents.messages = True
 intents.guilds = True
 intents.message_content = True
+intents.voice_states = True
+intents.reactions = True
+intents.presences = TRACK_PRESENCE
+
+# Member lists are loaded per guild in the background (or when a command first needs one)
+# instead of delaying on_ready until every guild is chunked
+if SHARD_COUNT or SHARD_IDS:
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS,
+        chunk_guilds_at_startup=False,
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, chunk_guilds_at_startup=False)
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-cache_ready = False
-cache_progress = 0  # 0 to 100
 
-# Activity cache: member_id -> last_active datetime
-activity_cache: Dict[int, datetime] = {}
+def owns_guild(guild_id: int) -> bool:
+    """Whether this process runs the shard of the guild (always, unless SHARD_IDS is set)."""
+    if not SHARD_IDS or not SHARD_COUNT:
+        return True
+    return shard_of(guild_id, SHARD_COUNT) in SHARD_IDS
 
 
-def create_embed(title: str, description: str, color=discord.Color.orange()):
-    return discord.Embed(title=title, description=description, color=color)
+guild_configs: Dict[int, GuildConfig] = load_guild_configs(GUILD_CONFIG_PATH)
+if GUILD_ID and GUILD_ID not in guild_configs:
+    guild_configs[GUILD_ID] = GuildConfig(
+        GUILD_ID, CLEANER_ROLE_ID, SOLDIER_ROLE_ID, GENERAL_ROLE_ID, list(EXEMPT_ROLE_IDS),
+        WARNING_CHANNEL_ID, STAFF_CHANNEL_ID, INACTIVITY_THRESHOLD, KICK_THRESHOLD,
+    )
 
+# Activity cache, store namespace, role index, metrics and check lock per configured guild
+# of this process's shards
+guild_states: Dict[int, GuildState] = {}
 
-async def get_last_activity(member: discord.Member, guild: discord.Guild) -> datetime:
-    latest_msg_time = member.joined_at or datetime(1970, 1, 1, tzinfo=timezone.utc)
+# All guild stores of this process share one connection; other processes write to the same
+# file, each only for its own guilds
+activity_db = connect(ACTIVITY_DB_PATH)
 
-    for channel in guild.text_channels:
-        if not channel.permissions_for(guild.me).read_messages:
-            continue
-        if channel.last_message_id is None:
-            continue
-        try:
-            async for msg in channel.history(limit=MAX_MESSAGE_LOOKBACK):
-                if msg.author.id == member.id:
-                    latest_msg_time = max(latest_msg_time, msg.created_at)
-        except asyncio.TimeoutError:
-            print(f"⏰ Timeout fetching history in #{channel.name} (ID: {channel.id})")
-        except (discord.Forbidden, discord.HTTPException) as e:
-            print(f"⚠️ Error reading #{channel.name} (ID: {channel.id}): {e}")
-            continue
+# One token bucket for every guild's scans: Discord's global limit is per bot, not per guild,
+# so processes that only run some of the shards get a matching share of it
+scan_pacer = RequestPacer(
+    SCAN_REQUESTS_PER_SECOND * len(SHARD_IDS) / SHARD_COUNT if SHARD_IDS and SHARD_COUNT else SCAN_REQUESTS_PER_SECOND
+)
 
-    return latest_msg_time
 
+def register_guild(config: GuildConfig) -> GuildState:
+    state = GuildState(config, ACTIVITY_DB_PATH, activity_db, ACTIVITY_FLUSH_MAX_PENDING)
+    guild_states[config.guild_id] = state
+    return state
 
-async def refresh_activity_cache(guild: discord.Guild):
-    global cache_ready, cache_progress
-    cache_ready = False
-    cache_progress = 0
-    activity_cache.clear()
 
-    non_bot_members = [m for m in guild.members if not m.bot]
-    total = len(non_bot_members)
+for _config in guild_configs.values():
+    if owns_guild(_config.guild_id):
+        register_guild(_config)
 
-    for index, member in enumerate(non_bot_members, start=1):
-        last_active = await get_last_activity(member, guild)
-        print(f"{member.display_name} last active: {last_active.isoformat()}")
-        
-        activity_cache[member.id] = last_active
 
-        # Update percentage progress
-        cache_progress = int((index / total) * 100)
+def create_embed(title: str, description: str, color=discord.Color.orange()):
+    return discord.Embed(title=title, description=description, color=color)
+
 
-    cache_progress = 100
-    cache_ready = True
+async def ensure_members(state: GuildState, guild: discord.Guild):
+    """
+    Load the guild's full member list if it isn't yet. Everything that walks
+    `guild.members` awaits this first; concurrent calls share one request.
+    """
+    if guild.chunked:
+        return
+    started = time.perf_counter()
+    await guild.chunk()
+    state.role_index.rebuild(guild.members)
+    state.metrics.set("member_chunk_seconds", time.perf_counter() - started)
+    if not state.metrics.get("startup_members_seconds"):
+        state.metrics.set("startup_members_seconds", time.monotonic() - STARTED_AT)
+    print(f"👥 Loaded {len(guild.members)} members of {guild.name} in {time.perf_counter() - started:.1f}s")
+
+
+async def refresh_activity_cache(state: GuildState, guild: discord.Guild):
+    metrics = state.metrics
+    store = state.store
+    # Members who aren't in the list are dropped from the snapshot, so it must be complete
+    await ensure_members(state, guild)
+    state.scanning = True
+    state.progress = 0
+
+    def update_progress(done: int, total: int, messages: int):
+        state.progress = int((done / total) * 100) if total else 100
+        state.scan_channels = (done, total)
+        state.scan_messages = messages
+
+    def save_checkpoint(channel, progress: ChannelProgress, authors: Dict[int, datetime]):
+        try:
+            store.save_channel_checkpoint(channel.id, progress, authors)
+        except sqlite3.Error as e:
+            # Only costs a longer rescan if the bot stops before the next checkpoint
+            print(f"⚠️ Could not checkpoint the scan of #{channel.name} in guild {state.guild_id}: {e}")
+
+    pacer = scan_pacer
+    waited_before = pacer.waited
+    metrics.start_scan()
+    try:
+        # Channels with a watermark only fetch what was posted since the last scan,
+        # the rest (new, recreated or never scanned) get a full lookback
+        watermarks = store.load_watermarks() if state.ready else {}
+        # Likewise, archived threads are only listed back to the previous listing of their parent
+        archive_marks = store.load_archive_marks() if state.ready else {}
+        # A scan interrupted by a restart continues where its channels stopped, with the
+        # same lookback, instead of reading everything again
+        checkpoint = store.load_scan_checkpoint()
+        if checkpoint and datetime.now(timezone.utc) - checkpoint.started <= SCAN_CHECKPOINT_MAX_AGE:
+            since = checkpoint.since
+            done = sum(progress.done for progress in checkpoint.channels.values())
+            print(f"⏯️ Resuming the activity scan of {guild.name} ({done} channels already done)")
+        else:
+            # History is only read back to the kick threshold: older messages can't change who gets kicked or demoted
+            since = datetime.now(timezone.utc) - timedelta(days=state.config.kick_days)
+            checkpoint = None
+            store.start_scan_checkpoint(since)
+        # What we already know per analyzed member; lets channel walks stop once older messages
+        # can't matter. Exempt members are left out: checks never act on them, and an exempt
+        # member who stays silent would otherwise keep every walk going back to `since`
+        analyzed = (member for member in guild.members if not state.role_index.is_exempt(member.id))
+        baseline = apply_join_defaults({}, analyzed, previous=state.activity)
+        with metrics.timed("scan"):
+            latest = await scan_channels(
+                guild,
+                None,
+                watermarks,
+                on_progress=update_progress,
+                concurrency=SCAN_CONCURRENCY,
+                pacer=pacer,
+                metrics=metrics,
+                since=since,
+                baseline=baseline,
+                resume=checkpoint.channels if checkpoint else None,
+                resumed_activity=checkpoint.activity if checkpoint else None,
+                on_checkpoint=save_checkpoint,
+                archive_marks=archive_marks,
+            )
+        # Long voice sessions only produce a state update when they start and end
+        fold_voice_members(guild, latest, datetime.now(timezone.utc))
+
+        # Build the next snapshot from the scan plus everything the current one knows
+        # (including live updates received during the scan), then swap it in. There is
+        # no await in between, so no live update can be lost, and readers still holding
+        # the old cache (e.g. a running export) finish on a consistent snapshot.
+        snapshot = apply_join_defaults(latest, guild.members, previous=state.activity)
+        state.activity = CompactActivity.from_mapping(snapshot)
+        state.version += 1
+        state.progress = 100
+        state.ready = True
+    finally:
+        state.scanning = False
+        waited = pacer.waited - waited_before
+        metrics.inc("rate_limit_wait_seconds_total", waited, source="pacer")
+        metrics.set("rate_limit_wait_last_seconds", waited, source="pacer")
+
+    store.replace_all(state.activity)
+    store.save_watermarks(watermarks)
+    store.save_archive_marks(archive_marks)
+    store.clear_scan_checkpoint()
+    record_inactivity_bands(state)
+    print(f"Activity scan finished for {guild.name}: {len(state.activity)} members cached (snapshot v{state.version})")
     
     
-def has_role(member, role_id):
-    return any(role.id == role_id for role in member.roles)
+def record_inactivity_bands(state: GuildState):
+    """Members per inactivity band of the current snapshot, as gauges."""
+    inactivity_days, kick_days = state.config.inactivity_days, state.config.kick_days
+    counts = state.activity.bucket_counts(datetime.now(timezone.utc).timestamp(), (inactivity_days, kick_days))
+    bands = (f"<{inactivity_days}d", f"{inactivity_days}-{kick_days}d", f">={kick_days}d")
+    for band, count in zip(bands, counts):
+        state.metrics.set("members_by_inactivity", count, band=band)
+
+
+def is_staff():
+    """Command check: used in a configured guild by a member with its General role."""
+    async def predicate(ctx):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        state = guild_states.get(ctx.guild.id)
+        if state is None:
+            raise commands.CheckFailure("This server is not configured yet. An admin can set it up with `!config`.")
+        if not is_staff_member(state, ctx.author):
+            raise commands.MissingRole(state.config.general_role_id)
+        return True
+    return commands.check(predicate)
+
+
+def is_staff_member(state: GuildState, member) -> bool:
+    return any(role.id == state.config.general_role_id for role in getattr(member, "roles", ()))
+
+
+def staff_channel_of(state: Optional[GuildState]):
+    return bot.get_channel(state.config.staff_channel_id) if state else None
+
+
+@bot.event
+async def on_member_join(member):
+    state = guild_states.get(member.guild.id)
+    if state:
+        state.role_index.update_member(member)
+        schedule_member(state, member)
+
+
+@bot.event
+async def on_member_update(before, after):
+    state = guild_states.get(after.guild.id)
+    if state:
+        state.role_index.update_member(after)
+        schedule_member(state, after)
+
+
+@bot.event
+async def on_member_remove(member):
+    state = guild_states.get(member.guild.id)
+    if state:
+        state.role_index.remove_member(member.id)
+        state.deadlines.discard(member.id)
+        state.demoted_at.pop(member.id, None)
+
+
+@bot.event
+async def on_guild_join(guild):
+    state = guild_states.get(guild.id)
+    if state and not state.config.missing():
+        state.role_index.rebuild(guild.members)
+        schedule_guild(state, guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    scheduler.remove(guild.id)
+    state = guild_states.get(guild.id)
+    if state:
+        state.deadlines.stop()
+
+
+@bot.event
+async def on_command_completion(ctx):
+    state = guild_states.get(ctx.guild.id) if ctx.guild else None
+    if state and not state.metrics.get("startup_first_command_seconds"):
+        latency = time.monotonic() - STARTED_AT
+        state.metrics.set("startup_first_command_seconds", latency)
+        print(f"⌨️ First command in guild {state.guild_id} (!{ctx.command.name}) answered {latency:.1f}s after startup")
 
 
 @bot.event
 async def on_command_error(ctx, error):
-    staff_channel = bot.get_channel(STAFF_CHANNEL_ID)
+    staff_channel = staff_channel_of(guild_states.get(ctx.guild.id)) if ctx.guild else None
     if staff_channel:
         embed = create_embed(
             title="Command Error ❌",
@@ -103,12 +321,15 @@ async def on_command_error(ctx, error):
             color=discord.Color.red()
         )
         await staff_channel.send(embed=embed)
+    elif isinstance(error, commands.CheckFailure):
+        # e.g. "not configured yet": without a staff channel, only the caller can see it
+        await ctx.send(f"⚠️ {error}")
     else:
         print(f"⚠️ Staff channel not found for error reporting.")
 
 
-async def report_error_to_staff(title: str, description: str):
-    staff_channel = bot.get_channel(STAFF_CHANNEL_ID)
+async def report_error_to_staff(state: GuildState, title: str, description: str):
+    staff_channel = staff_channel_of(state)
     if staff_channel:
         embed = create_embed(
             title=title,
@@ -120,13 +341,25 @@ async def report_error_to_staff(title: str, description: str):
         print(f"⚠️ Staff channel not found for error reporting.")
 
 
+def record_activity(guild_id: Optional[int], member_id: int, when: datetime):
+    """Record live activity in the guild's cache; ignored outside configured guilds (e.g. DMs)."""
+    state = guild_states.get(guild_id)
+    if state is None:
+        return
+    state.activity[member_id] = when
+    state.store.record(member_id, when)
+    # A Cleaner who is active again is restored right away; everyone else's next deadline
+    # only moves later, which the deadline queue finds out when the old one comes up
+    if state.role_index.is_cleaner(member_id) and state.deadlines.is_running():
+        state.deadlines.schedule(member_id, when.timestamp())
+
+
 @bot.event
 async def on_message_edit(before, after):
-    if after.author.bot:
-        return  # Ignore bots
+    if after.author.bot or after.guild is None:
+        return  # Ignore bots and DMs
 
-    if cache_ready:
-        activity_cache[after.author.id] = datetime.now(timezone.utc)
+    record_activity(after.guild.id, after.author.id, datetime.now(timezone.utc))
         
         
 @bot.event
@@ -134,15 +367,49 @@ async def on_message(message):
     if message.author.bot:
         return  # Ignore bots
 
-    if cache_ready:
-        # Only update cache if ready
-        activity_cache[message.author.id] = datetime.now(timezone.utc)
+    # Recorded even while scanning (threads and forum posts included); the next snapshot merges these in.
+    # Writes are coalesced per member in the store's buffer and flushed in batches.
+    if message.guild is not None:
+        record_activity(message.guild.id, message.author.id, message.created_at)
 
     await bot.process_commands(message)  # Always allow commands to run
+
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    if payload.guild_id is None or payload.member is None or payload.member.bot:
+        return
+    record_activity(payload.guild_id, payload.user_id, datetime.now(timezone.utc))
+
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    if member.bot:
+        return
+    # Joining, leaving, switching, muting... anything while connected counts
+    if before.channel is not None or after.channel is not None:
+        record_activity(member.guild.id, member.id, datetime.now(timezone.utc))
+
+
+@bot.event
+async def on_thread_create(thread):
+    if thread.owner_id is None:
+        return
+    owner = thread.owner
+    if owner is None or not owner.bot:
+        record_activity(thread.guild.id, thread.owner_id, datetime.now(timezone.utc))
+
+
+@bot.event
+async def on_presence_update(before, after):
+    if not TRACK_PRESENCE or after.bot:
+        return
+    if before.status == discord.Status.offline and after.status != discord.Status.offline:
+        record_activity(after.guild.id, after.id, datetime.now(timezone.utc))
         
         
 @bot.command(name="commands", help="Displays a list of all available bot commands (General role only).")
-@commands.has_role(GENERAL_ROLE_ID)
+@is_staff()
 async def list_commands(ctx):
     embed = discord.Embed(
         title="Available Bot Commands",
@@ -159,9 +426,9 @@ async def list_commands(ctx):
 
 
 @bot.command(help="Lists all channels the bot cannot read (due to missing permissions).")
-@commands.has_role(GENERAL_ROLE_ID)
+@is_staff()
 async def unreadable_channels(ctx):
-    guild = bot.get_guild(GUILD_ID)
+    guild = ctx.guild
     unreadable = [
         channel.name for channel in guild.text_channels
         if not channel.permissions_for(guild.me).read_messages
@@ -175,14 +442,25 @@ async def unreadable_channels(ctx):
         )
         
 
-@bot.command(help="Shows the last known activity date and server join date for a specific member.")
-@commands.has_role(GENERAL_ROLE_ID)
-async def lastactive(ctx, member: discord.Member):
-    if not cache_ready:
-        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {cache_progress}%. Try again in a few minutes.")
+@bot.command(
+    usage="<@member> [@member...]",
+    help="Shows the last known activity date and server join date of one or more members.",
+)
+@is_staff()
+async def lastactive(ctx, members: commands.Greedy[discord.Member]):
+    state = guild_states[ctx.guild.id]
+    if not members:
+        await ctx.send("⚠️ Mention at least one member, e.g. `!lastactive @someone @someone_else`.")
+        return
+    if not state.ready:
+        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {state.scan_status()}. Try again in a few minutes.")
+        return
+    if len(members) > 1:
+        await send_member_list(ctx, state, "🕵️ Last Activity", last_active_lines(state, members))
         return
 
-    last_active = activity_cache.get(member.id)
+    member = members[0]
+    last_active = state.activity.get(member.id)
     if not last_active:
         await ctx.send("⚠️ Activity data not yet available for this member. Try again later.")
         return
@@ -197,383 +475,517 @@ async def lastactive(ctx, member: discord.Member):
     )
     embed.add_field(name="📅 Joined Server", value=join_date, inline=False)
     embed.add_field(name="📊 Last Activity", value=f"{last_active_str} ({days_ago} days ago)", inline=False)
+    if state.scanning:
+        embed.set_footer(text=f"🔄 Activity rescan in progress ({state.scan_status()}), showing the previous snapshot plus live activity.")
 
     await ctx.send(embed=embed)
     
     
-@bot.command(help="Exports the activity cache as a CSV file, including inactive members and their roles.")
-@commands.has_role(GENERAL_ROLE_ID)
-async def exportactivity(ctx):
-    if not cache_ready:
-        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {cache_progress}%. Try again in a few minutes.")
+def last_active_lines(state: GuildState, members: List[discord.Member]) -> List[str]:
+    """One line per member, most inactive first; members without activity data last."""
+    now_ts = datetime.now(timezone.utc).timestamp()
+    known = sorted((m for m in members if m.id in state.activity), key=lambda m: state.activity.timestamp(m.id))
+    lines = [f"**{len(members)} members**"]
+    for member in known:
+        last_active = state.activity.timestamp(member.id)
+        date = datetime.fromtimestamp(last_active, timezone.utc).strftime('%Y-%m-%d')
+        joined = member.joined_at.strftime('%Y-%m-%d') if member.joined_at else "unknown"
+        lines.append(f"• `{member.display_name}` — {date} ({int((now_ts - last_active) // DAY)} days ago), joined {joined}")
+    lines.extend(f"• `{member.display_name}` — no activity data yet" for member in members if member.id not in state.activity)
+    return lines
+
+
+async def send_member_list(ctx, state: GuildState, title: str, lines: Iterable[str]):
+    """Paged member lines; pages are only rendered when they are reached."""
+    if state.scanning:
+        title += " (rescan in progress)"
+    view = ReportPaginator(paginate_lines(lines, EMBED_DESCRIPTION_LIMIT), title, ctx.author.id)
+    if view.single_page:
+        await ctx.send(embed=view.embed())
+    else:
+        await ctx.send(embed=view.embed(), view=view)
+
+
+@bot.command(
+    usage="<min_days> <max_days> [@role]",
+    help="Lists members last active between min_days and max_days ago (inclusive), most inactive first, "
+         "optionally only those with a role, e.g. `!inactive_between 60 90 @Soldier`.",
+)
+@is_staff()
+async def inactive_between(ctx, min_days: int, max_days: int, role: Optional[discord.Role] = None):
+    state = guild_states[ctx.guild.id]
+    if min_days < 0 or max_days < min_days:
+        await ctx.send("⚠️ Expected `0 <= min_days <= max_days`, e.g. `!inactive_between 60 90`.")
+        return
+    if not state.ready:
+        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {state.scan_status()}. Try again in a few minutes.")
         return
 
-    now = datetime.now(timezone.utc)
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["User ID", "Display Name", "Last Active (UTC)", "Days Ago", "Joined At (UTC)", "Roles"])
-
-    for member in ctx.guild.members:
-        if member.bot:
-            continue  # Skip bots
-
-        user_id = member.id
-        last_seen = activity_cache.get(user_id)
-        joined_at = member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else "Unknown"
-        roles = "; ".join(role.name for role in member.roles if role.name != "@everyone")
-
-        if last_seen:
-            days_ago = (now - last_seen).days
-            last_seen_str = last_seen.strftime('%Y-%m-%d %H:%M:%S')
-            days_ago_str = str(days_ago)
+    guild = ctx.guild
+    await ensure_members(state, guild)
+    now_ts = datetime.now(timezone.utc).timestamp()
+    matches = state.activity.inactive_between(now_ts, min_days, max_days)
+    if role is not None:
+        if role.id in state.role_index.by_role:
+            holders = state.role_index.by_role[role.id]
         else:
-            last_seen_str = "Never"
-            days_ago_str = "Not in cache"
-
-        writer.writerow([
-            str(user_id),
-            member.display_name,
-            last_seen_str,
-            days_ago_str,
-            joined_at,
-            roles
-        ])
-
-    output.seek(0)
-    csv_file = discord.File(fp=output, filename="activity_cache_full.csv")
-    await ctx.send("📁 Full activity cache including inactive members:", file=csv_file)
-
+            holders = {member.id for member in role.members}
+        matches = [(member_id, ts) for member_id, ts in matches if member_id in holders]
 
-@bot.command(help="Displays an inactivity report. Add 'clean' to only show members near Cleaner or kick thresholds.")
-@commands.has_role(GENERAL_ROLE_ID)
-async def inactivity_report(ctx, *args):
-    if not cache_ready:
-        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {cache_progress}%. Try again in a few minutes.")
+    label = f" with {role.name}" if role else ""
+    if not matches:
+        await ctx.send(f"✅ Nobody{label} was last active {min_days}-{max_days} days ago.")
         return
 
-    minimal = "clean" in args
-    guild = bot.get_guild(GUILD_ID)
-    if guild is None:
-        await ctx.send("⚠️ Guild not found. Please try again later.")
+    def lines():
+        yield f"**{len(matches)} members{label}**"
+        for member_id, ts in matches:
+            member = guild.get_member(member_id)
+            if member is not None:
+                date = datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+                yield f"• `{member.display_name}` — {date} ({int((now_ts - ts) // DAY)} days ago)"
+
+    await send_member_list(ctx, state, f"🕰️ Last active {min_days}-{max_days} days ago", lines())
+
+
+@bot.command(
+    usage="[@role] [min_days] [max_days]",
+    help="Exports the activity cache as gzip'd CSV, including inactive members and their roles. "
+         "Optionally filter by role and by days since last activity, e.g. `!exportactivity @Cleaner 60 90`."
+)
+@is_staff()
+async def exportactivity(ctx, role: Optional[discord.Role] = None, min_days: Optional[int] = None, max_days: Optional[int] = None):
+    state = guild_states[ctx.guild.id]
+    if not state.ready:
+        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {state.scan_status()}. Try again in a few minutes.")
         return
 
-    now = datetime.now(timezone.utc)
-
-    nearing_inactive = []
-    overdue_cleaners = []
-    cleaners_soon_kick = []
-    cleaners_overdue_kick = []
-    cleaner_list = []
-    active_members = []
-    uncached_members = []
-
-    for member in guild.members:
-        if member.bot:
-            continue
+    await ensure_members(state, ctx.guild)
+    rows = activity_rows(ctx.guild.members, state.activity, datetime.now(timezone.utc), role, min_days, max_days)
+    filters = []
+    if role:
+        filters.append(f"role `{role.name}`")
+    if min_days is not None or max_days is not None:
+        filters.append(f"last active {min_days or 0}–{max_days if max_days is not None else '∞'} days ago")
+    label = f" ({', '.join(filters)})" if filters else " including inactive members"
 
-        last_active = activity_cache.get(member.id)
-        joined_at = member.joined_at or now
-        days_since_join = (now - joined_at).days
-        is_cleaner = any(role.id == CLEANER_ROLE_ID for role in member.roles)
-        is_exempt = any(role.id in EXEMPT_ROLE_IDS for role in member.roles)
+    for number, (part, count) in enumerate(gzip_csv_parts(rows, ctx.guild.filesize_limit), start=1):
+        suffix = "" if number == 1 else f".part{number}"
+        csv_file = discord.File(fp=part, filename=f"activity_cache_full{suffix}.csv.gz")
+        heading = f"📁 Full activity cache{label}:" if number == 1 else f"📁 Part {number} ({count} members):"
+        await ctx.send(heading, file=csv_file)
 
-        if is_exempt:
-            continue
 
-        # Handle members who never became active
-        if not last_active:
-            if days_since_join >= INACTIVITY_THRESHOLD and not is_cleaner:
-                overdue_cleaners.append((member.display_name, f"{days_since_join} days ago joined, never active"))
-            elif not minimal:
-                uncached_members.append(member.display_name)
-            continue
-
-        days_since = (now - last_active).days
+@bot.command(help="Displays an inactivity report. Add 'clean' to only show members near Cleaner or kick thresholds.")
+@is_staff()
+async def inactivity_report(ctx, *args):
+    state = guild_states[ctx.guild.id]
+    if not state.ready:
+        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {state.scan_status()}. Try again in a few minutes.")
+        return
 
-        if is_cleaner:
-            kick_in_days = KICK_THRESHOLD - days_since
-            if kick_in_days <= 0:
-                cleaners_overdue_kick.append((member.display_name, f"{abs(kick_in_days)} days overdue"))
-            elif kick_in_days <= 14:
-                cleaners_soon_kick.append((member.display_name, f"{kick_in_days} days ahead"))
-            else:
-                cleaner_list.append((member.display_name, f"{kick_in_days} days ahead"))
-        else:
-            cleaner_in_days = INACTIVITY_THRESHOLD - days_since
-            if cleaner_in_days < 0:
-                overdue_cleaners.append((member.display_name, f"{abs(cleaner_in_days)} days overdue"))
-            elif cleaner_in_days <= 14:
-                nearing_inactive.append((member.display_name, f"{cleaner_in_days} days ahead"))
-            else:
-                if not minimal:
-                    active_members.append((member.display_name, f"{days_since} days ago"))
-
-    # Sort all lists
-    nearing_inactive.sort(key=lambda x: int(x[1].split()[0]))
-    overdue_cleaners.sort(key=lambda x: int(x[1].split()[0]))
-    cleaners_soon_kick.sort(key=lambda x: int(x[1].split()[0]))
-    cleaners_overdue_kick.sort(key=lambda x: int(x[1].split()[0]))
-    cleaner_list.sort(key=lambda x: int(x[1].split()[0]))
-    active_members.sort(key=lambda x: int(x[1].split()[0]))
-
-    # Compose embed description
-    desc = ""
-
-    def add_section(title, members):
-        nonlocal desc
-        if members:
-            desc += f"\n\n**{title} ({len(members)}):**\n"
-            desc += "\n".join(f"• `{name}` — {info}" for name, info in members)
-
-    add_section("✅ Active Members", active_members)
-    add_section("⚠️ Members nearing inactivity (Cleaner role)", nearing_inactive)
-    add_section("⏳ Members overdue for Cleaner role", overdue_cleaners)
-    add_section("🧹 Cleaners (not yet close to kick)", cleaner_list)
-    add_section("❗ Cleaners close to being kicked (≤14 days)", cleaners_soon_kick)
-    add_section("🔥 Cleaners overdue for kick", cleaners_overdue_kick)
-
-    if uncached_members and not minimal:
-        desc += f"\n\n**⚠️ Members not yet analyzed (no messages seen) ({len(uncached_members)}):**\n"
-        desc += "\n".join(f"• `{name}`" for name in uncached_members)
-
-    # Totals
-    total_count = len([
-        member for member in guild.members
-        if not member.bot and not any(role.id in EXEMPT_ROLE_IDS for role in member.roles)
-    ])
-
-    listed_count = (
-        len(active_members)
-        + len(nearing_inactive)
-        + len(cleaner_list)
-        + len(overdue_cleaners)
-        + len(cleaners_soon_kick)
-        + len(cleaners_overdue_kick)
-        + (len(uncached_members) if not minimal else 0)
+    minimal = "clean" in args
+    guild = ctx.guild
+    await ensure_members(state, guild)
+    report = build_report(
+        guild.members, state.activity, datetime.now(timezone.utc), minimal,
+        state.role_index, state.config.inactivity_days, state.config.kick_days,
     )
-
-    desc += f"\n\n**👥 Members displayed: `{listed_count}` / Analyzed (excluding bots & exempt): `{total_count}`**"
-
-    if not desc.strip():
-        desc = "✅ All members are active or not near cleanup thresholds."
-
-    embed = create_embed("🕓 Inactivity Report", desc.strip(), discord.Color.blurple())
-    await ctx.send(embed=embed)
+    view = ReportPaginator(report_pages(report), "🕓 Inactivity Report", ctx.author.id)
+    if view.single_page:
+        await ctx.send(embed=view.embed())
+    else:
+        await ctx.send(embed=view.embed(), view=view)
     
     
-async def check_inactive_members_function():
-    print("Waiting for inactivity_check_lock...")
-    async with inactivity_check_lock:
-        print("Acquired inactivity_check_lock, starting check...")
+async def check_inactive_members_function(state: GuildState):
+    print(f"Waiting for the inactivity check lock of guild {state.guild_id}...")
+    async with state.lock:
+        print(f"Acquired the inactivity check lock of guild {state.guild_id}, starting check...")
         
-        guild = bot.get_guild(GUILD_ID)
+        guild = bot.get_guild(state.guild_id)
         if not guild:
             print("Guild not found.")
             return
+        missing = state.config.missing()
+        if missing:
+            print(f"Guild {guild.name} is missing {', '.join(missing)} in its config, skipping the check.")
+            return
     
-        print(f"Activity cache before refresh: {len(activity_cache)}")  # Debug log
+        print(f"Activity cache before refresh: {len(state.activity)}")  # Debug log
         try:
-            await refresh_activity_cache(guild)
+            await refresh_activity_cache(state, guild)
         except Exception as e:
             await report_error_to_staff(
+                state,
                 "Unexpected Error ❌",
                 f"While updating the cache an unexpected error occured : `{str(e)}`"
             )
-        print(f"Activity cache after refresh: {len(activity_cache)}")  # Debug log
-    
-        now = datetime.now(timezone.utc)
-        inactive_cutoff = now - timedelta(days=INACTIVITY_THRESHOLD)
-        kick_cutoff = now - timedelta(days=KICK_THRESHOLD)
-        warning_channel = guild.get_channel(WARNING_CHANNEL_ID)
-    
-        for member in guild.members:
-            if member.bot or any(r.id in EXEMPT_ROLE_IDS for r in member.roles):
-                print(f"Skipping {member.display_name} ({member.id}): Bot or exempt role")
-                continue
-        
-            last_active = activity_cache.get(member.id)
-            days_since_join = (now - (member.joined_at or now)).days
-        
-            if days_since_join < INACTIVITY_THRESHOLD and (last_active is None or (now - last_active).days < INACTIVITY_THRESHOLD):
-                print(f"Skipping {member.display_name} ({member.id}): Joined {days_since_join} days ago or active in last {INACTIVITY_THRESHOLD} days")
-                continue
-                
-            cleaner_role = guild.get_role(CLEANER_ROLE_ID)
-            soldier_role = guild.get_role(SOLDIER_ROLE_ID)
-    
-            # 🧹 Handle members who never became active
-            if last_active is None:
-                print(f"{member.display_name} ({member.id}) has never been active, joined {days_since_join} days ago")
-            
-                if cleaner_role in member.roles and days_since_join >= KICK_THRESHOLD:
-                    try:
-                        await member.kick(reason=f"Inactive for more than {KICK_THRESHOLD} days (never active)")
-                        print(f"Kicked (never active): {member.name}")
-                        if warning_channel:
-                            embed = create_embed(
-                                title="Member kicked for inactivity 🧹",
-                                description=f"{member.display_name} was kicked for never being active and {days_since_join} days on the server.",
-                                color=discord.Color.red()
-                            )
-                            await warning_channel.send(embed=embed)
-                    except discord.Forbidden:
-                        await report_error_to_staff(
-                            "Permission Error ❌",
-                            f"No permission to kick `{member.display_name}` (`{member.id}`) who never became active."
-                        )
-                    except Exception as e:
-                        await report_error_to_staff(
-                            "Unexpected Error ❌",
-                            f"While kicking inactive (never active) member `{member.display_name}` (`{member.id}`): `{str(e)}`"
-                        )
-                    continue
-            
-                # Assign Cleaner if overdue for inactivity marking
-                if cleaner_role not in member.roles and days_since_join >= INACTIVITY_THRESHOLD:
-                    roles_to_remove = [
-                        r for r in member.roles
-                        if r.id not in EXEMPT_ROLE_IDS and r != guild.default_role
-                    ]
-                    try:
-                        if roles_to_remove:
-                            await member.remove_roles(*roles_to_remove, reason="Marked inactive (never active)")
-            
-                        if cleaner_role:
-                            await member.add_roles(cleaner_role, reason="Inactive (never active)")
-                            if warning_channel:
-                                await warning_channel.send(embed=create_embed(
-                                    "Inactivity detected 🙁",
-                                    f"Attention {member.mention}, you have been marked as inactive and therefore "
-                                    f"degraded to the `Cleaner` role. 🙁🧹 Sorry, there is no kitchen service on this server. 😂\n"
-                                    f"Please become active to avoid removal. 🙏🏻\n\n"
-                                    f"For Admin's reference: Original roles before cleanup: "
-                                    f"`{', '.join([r.name for r in roles_to_remove]) or 'None'}`."
-                                ))
-            
-                        if soldier_role and soldier_role not in member.roles:
-                            await member.add_roles(soldier_role, reason="Maintain Soldier role")
-            
-                    except discord.Forbidden:
-                        await report_error_to_staff(
-                            "Permission Error ❌",
-                            f"No permission to update roles for `{member.display_name}` (`{member.id}`) when setting to `Cleaner`."
-                        )
-                    except Exception as e:
-                        await report_error_to_staff(
-                            "Unexpected Error ❌",
-                            f"While updating role to `Cleaner` `{member.display_name}` (`{member.id}`): `{str(e)}`"
-                        )
-                continue
-    
-            days_since = (now - last_active).days
-    
-            # ✅ Became active again
-            if cleaner_role in member.roles and last_active >= inactive_cutoff:
-                print(f"{member.display_name} ({member.id}) is Cleaner but became active again")
-                try:
-                    await member.remove_roles(cleaner_role, reason="Active again")
-                    if warning_channel:
-                        await warning_channel.send(embed=create_embed(
-                            "Member active again ✅",
-                            f"{member.mention} became active again. `Cleaner` role removed.\n"
-                            f"<@&{GENERAL_ROLE_ID}> may want to restore previous roles.",
-                            discord.Color.green()
-                        ))
-                except discord.Forbidden:
-                    await report_error_to_staff(
-                        "Permission Error ❌",
-                        f"No permission to update roles for `{member.display_name}` (`{member.id}`) when removing `Cleaner`."
-                    )
-                except Exception as e:
-                    await report_error_to_staff(
-                        "Unexpected Error ❌",
-                        f"While updating roles for `{member.display_name}` (`{member.id}`): `{str(e)}`"
-                    )
-                continue
-    
-            # 🚫 Kick after KICK_THRESHOLD days of inactivity (verification step)
-            if cleaner_role in member.roles and last_active < kick_cutoff:
-                print(f"{member.display_name} ({member.id}) is overdue for kick ({(now - last_active).days} days inactive)")
-                try:
-                    await member.kick(reason=f"Inactive for {days_since} days")
-                    print(f"Kicked: {member.name}")
-                    if warning_channel:
-                        embed = create_embed(
-                            title="Member kicked for inactivity 🧹",
-                            description=f"{member.display_name} was kicked for {KICK_THRESHOLD}+ days of inactivity.",
-                            color=discord.Color.red()
-                        )
-                        await warning_channel.send(embed=embed)
-                except discord.Forbidden:
-                    await report_error_to_staff(
-                        "Permission Error ❌",
-                        f"No permission to kick `{member.display_name}` (`{member.id}`)."
-                    )
-                except Exception as e:
-                    await report_error_to_staff(
-                        "Unexpected Error ❌",
-                        f"While kicking member `{member.display_name}` (`{member.id}`): `{str(e)}`"
-                    )
-                continue
-    
-            # 🧹 Mark as inactive if over INACTIVITY_THRESHOLD days and not yet a Cleaner
-            if cleaner_role not in member.roles and last_active < inactive_cutoff:
-                print(f"{member.display_name} ({member.id}) is overdue for Cleaner role ({(now - last_active).days} days inactive)")
-                roles_to_remove = [
-                    r for r in member.roles
-                    if r.id not in EXEMPT_ROLE_IDS and r != guild.default_role
-                ]
-                try:
-                    if roles_to_remove:
-                        await member.remove_roles(*roles_to_remove, reason="Marked inactive")
-    
-                    if cleaner_role:
-                        await member.add_roles(cleaner_role, reason=f"Inactive {INACTIVITY_THRESHOLD}+ days")
-                        if warning_channel:
-                            await warning_channel.send(embed=create_embed(
-                                "Inactivity detected 🙁",
-                                f"Attention {member.mention}, you have been marked as inactive and therefore "
-                                f"degraded to the `Cleaner` role. 🙁🧹 Sorry, there is no kitchen service on this server. 😂\n"
-                                f"Please become active to avoid removal. 🙏🏻\n\n"
-                                f"For Admin's reference: Original roles before cleanup: "
-                                f"`{', '.join([r.name for r in roles_to_remove]) or 'None'}`."
-                            ))
-    
-                    if soldier_role and soldier_role not in member.roles:
-                        await member.add_roles(soldier_role, reason="Maintain Soldier role")
+        print(f"Activity cache after refresh: {len(state.activity)}")  # Debug log
+
+        if not state.ready:
+            # Without a complete snapshot everyone would look inactive
+            print("No complete activity snapshot, skipping role changes.")
+            return
     
-                except discord.Forbidden:
-                    await report_error_to_staff(
-                        "Permission Error ❌",
-                        f"No permission to update roles for `{member.display_name}` (`{member.id}`) when setting to `Cleaner`."
-                    )
-                except Exception as e:
-                    await report_error_to_staff(
-                        "Unexpected Error ❌",
-                        f"While updating role to `Cleaner` `{member.display_name}` (`{member.id}`): `{str(e)}`"
-                    )
-
-
-@bot.command(name="run_inactivity_check", aliases=["check_inactive", "manual_inactive_check"], help="Runs the inactivity check manually.")
-@commands.has_role(GENERAL_ROLE_ID)
-async def run_inactivity_check(ctx):
-    if inactivity_check_lock.locked():
+        # Reconcile the role index in case a member event was missed
+        state.role_index.rebuild(guild.members)
+
+        # Members whose action failed since the last full check get one more try now
+        state.failed.clear()
+        plan = plan_check(state, guild)
+        print(f"Planned {len(plan)} actions, executing...")
+        await execute_plan(state, guild, plan)
+        state.metrics.inc("inactivity_checks_total")
+        arm_deadlines(state, guild)
+
+
+def schedule_member(state: GuildState, member: discord.Member, acted: bool = False):
+    """
+    Plan the member's next threshold crossing; nothing until the guild's
+    deadlines are armed. Right after an action (`acted`) the next deadline
+    must lie in the future; one that doesn't would act on the member again
+    straight away, so they are left to the next full check instead, like
+    members whose last action failed.
+    """
+    if not state.deadlines.is_running():
+        return
+    if member.id in state.failed:
+        state.deadlines.discard(member.id)
+        return
+    config = state.config
+    now_ts = datetime.now(timezone.utc).timestamp()
+    due = member_deadline(
+        member, state.activity, member.guild.get_role(config.cleaner_role_id), state.role_index,
+        now_ts, config.inactivity_days, config.kick_days, state.demoted_at,
+    )
+    if due is not None and acted and due <= now_ts:
+        print(f"⚠️ {member.display_name} ({member.id}) would be due again right after an action, leaving them to the next full check")
+        due = None
+    if due is None:
+        state.deadlines.discard(member.id)
+    else:
+        state.deadlines.schedule(member.id, due)
+
+
+def arm_deadlines(state: GuildState, guild: discord.Guild):
+    """
+    Plan every member's next threshold crossing and act on each one when it
+    comes up. Members whose action failed wait for the next full check.
+    """
+    config = state.config
+    now_ts = datetime.now(timezone.utc).timestamp()
+    cleaner_role = guild.get_role(config.cleaner_role_id)
+    state.deadlines.clear()
+    if cleaner_role is None:
+        stop_deadlines(state, guild)
+        return
+    for member in guild.members:
+        if member.id in state.failed:
+            continue
+        due = member_deadline(
+            member, state.activity, cleaner_role, state.role_index,
+            now_ts, config.inactivity_days, config.kick_days, state.demoted_at,
+        )
+        if due is not None:
+            state.deadlines.schedule(member.id, due)
+    state.deadlines.start(lambda member_ids: process_member_deadlines(state, member_ids))
+    state.metrics.set("member_deadlines", len(state.deadlines))
+
+
+def stop_deadlines(state: GuildState, guild: discord.Guild):
+    """
+    Without the Cleaner role nobody counts as a Cleaner, so every demotion
+    would come due again at once. Deadlines stay off until they are armed
+    again: by the next full check, or by the catch-up once `!config` names
+    a new Cleaner role.
+    """
+    print(f"⚠️ Cleaner role {state.config.cleaner_role_id} not found in {guild.name}, not acting on member deadlines")
+    state.deadlines.stop()
+    state.deadlines.clear()
+    state.metrics.set("member_deadlines", 0)
+
+
+async def process_member_deadlines(state: GuildState, member_ids: List[int]):
+    """
+    Act on members whose deadline came up. Members whose deadline moved since
+    it was planned (active again, roles changed) are only rescheduled.
+    """
+    guild = bot.get_guild(state.guild_id)
+    if guild is None or not state.ready or state.config.missing():
+        return
+    config = state.config
+    now = datetime.now(timezone.utc)
+    cleaner_role, soldier_role = guild.get_role(config.cleaner_role_id), guild.get_role(config.soldier_role_id)
+    if cleaner_role is None:
+        stop_deadlines(state, guild)
+        return
+    plan = []
+    for member_id in member_ids:
+        member = guild.get_member(member_id)
+        if member is None or member_id in state.acting or member_id in state.failed:
+            continue
+        due = member_deadline(
+            member, state.activity, cleaner_role, state.role_index,
+            now.timestamp(), config.inactivity_days, config.kick_days, state.demoted_at,
+        )
+        if due is not None and due > now.timestamp():
+            state.deadlines.schedule(member_id, due)
+            continue
+        action = plan_member_action(
+            member, guild, state.activity, now, cleaner_role, soldier_role,
+            state.role_index, config.inactivity_days, config.kick_days, state.demoted_at,
+        )
+        if action:
+            plan.append(action)
+    state.metrics.set("member_deadlines", len(state.deadlines))
+    if plan:
+        state.metrics.inc("deadline_actions_total", len(plan))
+        await execute_plan(state, guild, plan)
+
+
+def plan_check(state: GuildState, guild: discord.Guild) -> List[PlannedAction]:
+    """Everything the check would do with the current cache; changes nothing."""
+    config = state.config
+    with state.metrics.timed("classification"):
+        return plan_inactivity_actions(
+            guild, state.activity, datetime.now(timezone.utc),
+            guild.get_role(config.cleaner_role_id), guild.get_role(config.soldier_role_id),
+            state.role_index, config.inactivity_days, config.kick_days, state.demoted_at,
+        )
+
+
+async def execute_plan(state: GuildState, guild: discord.Guild, plan: List[PlannedAction]):
+    """Apply a plan and post its notification and error digests."""
+    config = state.config
+    metrics = state.metrics
+    cleaner_role = guild.get_role(config.cleaner_role_id)
+    warning_channel = guild.get_channel(config.warning_channel_id)
+
+    # A member can come up in the full check and in their own deadline at the same time
+    plan = [action for action in plan if action.member.id not in state.acting]
+    state.acting.update(action.member.id for action in plan)
+
+    warnings = DigestBatcher("🧹 Inactivity check results")
+    staff_errors = DigestBatcher("Inactivity check errors ❌", discord.Color.red())
+
+    async def notify(action: PlannedAction):
+        # Track the change now rather than when the gateway echoes it, so the member's next
+        # deadline follows from the new roles
+        if action.kind == KICK:
+            print(f"Kicked{' (never active)' if action.never_active else ''}: {action.member.name}")
+            state.role_index.remove_member(action.member.id)
+            state.deadlines.discard(action.member.id)
+            state.demoted_at.pop(action.member.id, None)
+        else:
+            if action.kind == DEMOTE:
+                state.demoted_at[action.member.id] = datetime.now(timezone.utc).timestamp()
+            else:
+                state.demoted_at.pop(action.member.id, None)
+            state.role_index.set_roles(action.member.id, action.roles)
+            state.acting.discard(action.member.id)
+            schedule_member(state, action.member, acted=True)
+        add_action_notice(warnings, action, cleaner_role, config)
+
+    async def report_failure(action: PlannedAction, error: Exception):
+        # Retrying from the deadline queue would fail the same way right away (e.g. Forbidden)
+        state.failed.add(action.member.id)
+        state.deadlines.discard(action.member.id)
+        title, description = action_error_report(action, error)
+        staff_errors.add(title, description)
+
+    with metrics.timed("actions"):
+        try:
+            await execute_actions(
+                plan, notify, report_failure, concurrency=MODERATION_CONCURRENCY, metrics=metrics,
+            )
+        finally:
+            state.acting.difference_update(action.member.id for action in plan)
+
+        try:
+            sent = await warnings.flush(warning_channel)
+            metrics.inc("rest_calls_total", sent, kind="notification")
+        except Exception as e:
+            staff_errors.add("Unexpected Error ❌", f"While sending inactivity notifications: `{str(e)}`")
+        sent = await staff_errors.flush(staff_channel_of(state))
+        metrics.inc("rest_calls_total", sent, kind="notification")
+
+    dump_metrics()
+
+
+def metrics_path() -> str:
+    """METRICS_FILE, with the shards in the name when other processes write their own file."""
+    if not SHARD_IDS:
+        return METRICS_FILE
+    root, ext = os.path.splitext(METRICS_FILE)
+    return f"{root}.shards-{'-'.join(map(str, SHARD_IDS))}{ext}"
+
+
+def dump_metrics():
+    if not METRICS_FILE:
+        return
+    try:
+        dump_prometheus(metrics_path(), [state.metrics for _, state in sorted(guild_states.items())])
+    except OSError as e:
+        print(f"⚠️ Could not write metrics to {METRICS_FILE}: {e}")
+
+
+def add_action_notice(digest: DigestBatcher, action: PlannedAction, cleaner_role, config: GuildConfig):
+    member = action.member
+    if action.kind == KICK:
+        if action.never_active:
+            line = f"`{member.display_name}` — never active, {action.days} days on the server"
+        else:
+            line = f"`{member.display_name}` — {config.kick_days}+ days of inactivity"
+        digest.add("Members kicked for inactivity 🧹", line)
+    elif action.kind == RESTORE:
+        digest.add(
+            "Members active again ✅",
+            f"{member.mention} — `Cleaner` role removed",
+            mention=member.mention,
+            mention_text=("", f" became active again. `Cleaner` role removed.\n"
+                              f"<@&{config.general_role_id}> may want to restore previous roles."),
+        )
+    elif cleaner_role is not None:  # Without a Cleaner role there is nothing to announce
+        digest.add(
+            "Inactivity detected 🙁",
+            f"{member.mention} — original roles before cleanup: "
+            f"`{', '.join([r.name for r in action.removed_roles]) or 'None'}`",
+            mention=member.mention,
+            mention_text=("Attention ", ", you have been marked as inactive and therefore "
+                                        "degraded to the `Cleaner` role. 🙁🧹 Sorry, there is no kitchen service on this server. 😂\n"
+                                        "Please become active to avoid removal. 🙏🏻"),
+        )
+
+
+def action_error_report(action: PlannedAction, error: Exception) -> Tuple[str, str]:
+    who = f"`{action.member.display_name}` (`{action.member.id}`)"
+    if isinstance(error, discord.Forbidden):
+        if action.kind == KICK:
+            suffix = " who never became active" if action.never_active else ""
+            return "Permission Error ❌", f"No permission to kick {who}{suffix}."
+        if action.kind == RESTORE:
+            return "Permission Error ❌", f"No permission to update roles for {who} when removing `Cleaner`."
+        return "Permission Error ❌", f"No permission to update roles for {who} when setting to `Cleaner`."
+
+    if action.kind == KICK:
+        what = "kicking inactive (never active) member" if action.never_active else "kicking member"
+        return "Unexpected Error ❌", f"While {what} {who}: `{str(error)}`"
+    if action.kind == RESTORE:
+        return "Unexpected Error ❌", f"While updating roles for {who}: `{str(error)}`"
+    return "Unexpected Error ❌", f"While updating role to `Cleaner` {who}: `{str(error)}`"
+
+
+@bot.command(
+    name="run_inactivity_check",
+    aliases=["check_inactive", "manual_inactive_check"],
+    usage="[dry]",
+    help="Runs the inactivity check manually. With `dry`, only shows what it would do, using the current cache "
+         "without a rescan, and lets staff approve and run exactly that plan.",
+)
+@is_staff()
+async def run_inactivity_check(ctx, mode: Optional[str] = None):
+    state = guild_states[ctx.guild.id]
+    if mode not in (None, "dry"):
+        # Anything else might be a mistyped `dry`; never run the real check for it
+        await ctx.send(f"⚠️ Unknown mode `{mode}`. Usage: `!run_inactivity_check` or `!run_inactivity_check dry`.")
+        return
+    if state.lock.locked():
         await ctx.send("⚠️ Inactivity check is already running. Please wait.")
         return
+    missing = state.config.missing()
+    if missing:
+        await ctx.send(f"⚠️ Set {', '.join(f'`{name}`' for name in missing)} with `!config` first.")
+        return
+    if mode == "dry":
+        await send_plan_preview(ctx, state)
+        return
 
     await ctx.send("✅ Running inactivity check...")
     try:
-        await check_inactive_members_function()
+        await check_inactive_members_function(state)
     except Exception as e:
         print(f"❌ Inactivity check failed: {e}")
         await ctx.send(f"❌ Inactivity check failed: {e}")
     await ctx.send("✅ Inactivity check completed.")
 
 
+async def send_plan_preview(ctx, state: GuildState):
+    if not state.ready:
+        await ctx.send(f"⏳ Please wait, I'm still scanning activity. Status: {state.scan_status()}. Try again in a few minutes.")
+        return
+
+    guild = ctx.guild
+    await ensure_members(state, guild)
+    plan = plan_check(state, guild)
+    state.metrics.inc("dry_runs_total")
+    title = f"🧪 Inactivity check plan (snapshot v{state.version}, nothing changed yet)"
+    if not plan:
+        await ctx.send(embed=discord.Embed(title=title, description="✅ Nothing to do.", color=discord.Color.green()))
+        return
+
+    version = state.version
+
+    async def approve(interaction: discord.Interaction) -> str:
+        if state.lock.locked():
+            return "⚠️ another inactivity check was running, nothing was changed"
+        async with state.lock:
+            if state.version != version:
+                return (f"⚠️ the activity snapshot changed since this preview (v{version} → v{state.version}), "
+                        f"nothing was changed. Run `!run_inactivity_check dry` again")
+            current, changed = still_planned(state, guild, plan)
+            state.metrics.inc("approved_plans_total")
+            await execute_plan(state, guild, current)
+            state.metrics.inc("inactivity_checks_total")
+        skipped = f", {changed} skipped because they changed since the preview" if changed else ""
+        return f"✅ {len(current)} actions applied{skipped}"
+
+    view = PlanApprovalView(
+        plan_diff_pages(plan), title, ctx.author.id, approve,
+        can_approve=lambda user: is_staff_member(state, user), timeout=PLAN_APPROVAL_SECONDS,
+    )
+    view.message = await ctx.send(embed=view.embed(), view=view)
+
+
+def role_ids(roles: Optional[Iterable[discord.Role]]) -> Set[int]:
+    return {role.id for role in roles or ()}
+
+
+def still_planned(state: GuildState, guild: discord.Guild, plan: List[PlannedAction]) -> Tuple[List[PlannedAction], int]:
+    """
+    The previewed actions that planning now would still produce unchanged, and
+    how many were dropped. A member whose roles or activity changed since the
+    preview (e.g. staff gave them a role, or a deadline already acted on them)
+    is left alone instead of getting a role list that is out of date; members
+    who left are dropped without counting.
+    """
+    config = state.config
+    now = datetime.now(timezone.utc)
+    cleaner_role, soldier_role = guild.get_role(config.cleaner_role_id), guild.get_role(config.soldier_role_id)
+    current, changed = [], 0
+    for action in plan:
+        member = guild.get_member(action.member.id)
+        if member is None:
+            continue
+        replanned = plan_member_action(
+            member, guild, state.activity, now, cleaner_role, soldier_role,
+            state.role_index, config.inactivity_days, config.kick_days, state.demoted_at,
+        )
+        if (
+            replanned is None or replanned.kind != action.kind
+            or role_ids(replanned.roles) != role_ids(action.roles)
+            or role_ids(replanned.removed_roles) != role_ids(action.removed_roles)
+        ):
+            changed += 1
+            continue
+        current.append(replanned)
+    return current, changed
+
+
 @bot.command(name="next_check", help="Shows the next scheduled run of the inactivity check.")
-@commands.has_role(GENERAL_ROLE_ID)
+@is_staff()
 async def next_check(ctx):
-    next_run = check_inactive_members_task.next_iteration
+    next_run = scheduler.next_run(ctx.guild.id)
     if next_run:
         await ctx.send(
             embed=discord.Embed(
@@ -592,16 +1004,291 @@ async def next_check(ctx):
         )
 
 
-@tasks.loop(hours=24)
-async def check_inactive_members_task():
-    await check_inactive_members_function()
+@bot.command(name="scanstats", help="Shows metrics of the last activity scan and inactivity check (durations, API calls, slowest channels).")
+@is_staff()
+async def scanstats(ctx):
+    state = guild_states[ctx.guild.id]
+    metrics = state.metrics
+    status = f"🔄 Scanning ({state.scan_status()})" if state.scanning else f"Snapshot v{state.version}"
+    embed = discord.Embed(title="📈 Scan Statistics", description=status, color=discord.Color.blurple())
+
+    phases = "\n".join(f"{phase}: `{seconds:.1f}s`" for phase, seconds in metrics.phases.items())
+    embed.add_field(name="⏱️ Last phase durations", value=phases or "No run yet", inline=False)
+
+    embed.add_field(
+        name="🌐 API",
+        value=(
+            f"History messages: `{int(metrics.total('history_messages_total'))}`\n"
+            f"History pages: `{int(metrics.total('history_pages_total'))}`\n"
+            f"REST calls: `{int(metrics.total('rest_calls_total'))}`\n"
+            f"Rate-limit wait (last scan): `{metrics.get('rate_limit_wait_last_seconds', source='pacer'):.1f}s`\n"
+            f"Channel read errors: `{int(metrics.total('history_errors_total'))}`"
+        ),
+        inline=False,
+    )
+
+    actions = [
+        f"{kind}: `{int(metrics.get('actions_total', kind=kind, result='ok'))}` ok, "
+        f"`{int(metrics.get('actions_total', kind=kind, result='failed'))}` failed"
+        for kind in (DEMOTE, RESTORE, KICK)
+    ]
+    embed.add_field(name="🧹 Actions (since start)", value="\n".join(actions), inline=False)
+
+    embed.add_field(
+        name="💾 Activity writes (since start)",
+        value=(
+            f"Updates received: `{int(metrics.total('activity_updates_total'))}`\n"
+            f"Rows written: `{int(metrics.total('activity_flushed_rows_total'))}` "
+            f"in `{int(metrics.total('activity_flushes_total'))}` flushes\n"
+            f"Buffered now: `{state.store.pending}`\n"
+            f"Flush latency: `{metrics.get('activity_flush_last_seconds') * 1000:.1f}ms` last, "
+            f"`{metrics.get('activity_flush_max_seconds') * 1000:.1f}ms` max"
+        ),
+        inline=False,
+    )
+
+    def since_start(name: str) -> str:
+        seconds = metrics.get(name)
+        return f"`{seconds:.1f}s`" if seconds else "not yet"
+
+    embed.add_field(
+        name="🚀 Startup (since process start)",
+        value=(
+            f"Gateway ready: {since_start('startup_ready_seconds')}\n"
+            f"Member list loaded: {since_start('startup_members_seconds')}\n"
+            f"First command answered: {since_start('startup_first_command_seconds')}"
+        ),
+        inline=False,
+    )
+
+    slowest = metrics.slowest_channels(10)
+    if slowest:
+        embed.add_field(
+            name="🐢 Slowest channels (last scan)",
+            value="\n".join(
+                f"<#{channel_id}> `{stats.seconds:.1f}s` · {stats.messages} msgs · {stats.pages} pages"
+                for channel_id, stats in slowest
+            ),
+            inline=False,
+        )
+
+    await ctx.send(embed=embed)
+
+
+# !config settings: name -> (GuildConfig field, kind)
+CONFIG_SETTINGS = {
+    "cleaner_role": ("cleaner_role_id", "role"),
+    "soldier_role": ("soldier_role_id", "role"),
+    "general_role": ("general_role_id", "role"),
+    "exempt_roles": ("exempt_role_ids", "roles"),
+    "warning_channel": ("warning_channel_id", "channel"),
+    "staff_channel": ("staff_channel_id", "channel"),
+    "inactivity_days": ("inactivity_days", "days"),
+    "kick_days": ("kick_days", "days"),
+}
+
+
+def config_embed(config: GuildConfig) -> discord.Embed:
+    def show(value, kind):
+        if kind == "days":
+            return f"`{value}`"
+        if kind == "roles":
+            return ", ".join(f"<@&{role_id}>" for role_id in value) or "None"
+        if not value:
+            return "⚠️ Not set"
+        return f"<@&{value}>" if kind == "role" else f"<#{value}>"
+
+    embed = discord.Embed(title="⚙️ Server Configuration", color=discord.Color.blurple())
+    for name, (field_name, kind) in CONFIG_SETTINGS.items():
+        embed.add_field(name=name, value=show(getattr(config, field_name), kind), inline=True)
+    missing = config.missing()
+    if missing:
+        embed.set_footer(text=f"Inactivity checks stay off until these are set: {', '.join(missing)}")
+    return embed
+
+
+@bot.command(
+    name="config",
+    usage="[setting] [value ...]",
+    help="Shows or changes this server's settings, e.g. `!config cleaner_role @Cleaner`, "
+         "`!config exempt_roles @Major @General` or `!config kick_days 180` (Manage Server or General role).",
+)
+@commands.check_any(commands.has_guild_permissions(manage_guild=True), is_staff())
+async def config(ctx, setting: Optional[str] = None, *values: str):
+    guild = ctx.guild
+    current = guild_configs.get(guild.id) or GuildConfig(guild.id)
+    if setting is None:
+        await ctx.send(embed=config_embed(current))
+        return
+    if setting not in CONFIG_SETTINGS:
+        await ctx.send(f"⚠️ Unknown setting `{setting}`. Available: {', '.join(f'`{name}`' for name in CONFIG_SETTINGS)}")
+        return
+
+    field_name, kind = CONFIG_SETTINGS[setting]
+    try:
+        if kind == "days":
+            value = int(values[0]) if len(values) == 1 else 0
+            if value <= 0:
+                raise commands.BadArgument("Expected a positive number of days.")
+        elif kind == "roles":
+            value = [(await commands.RoleConverter().convert(ctx, arg)).id for arg in values]
+        elif len(values) != 1:
+            raise commands.BadArgument(f"Expected exactly one {kind}.")
+        elif kind == "role":
+            value = (await commands.RoleConverter().convert(ctx, values[0])).id
+        else:
+            value = (await commands.TextChannelConverter().convert(ctx, values[0])).id
+    except (commands.BadArgument, ValueError) as e:
+        await ctx.send(f"⚠️ Invalid value for `{setting}`: {e}")
+        return
+
+    updated = replace(current, **{field_name: value})
+    if updated.inactivity_days >= updated.kick_days:
+        await ctx.send("⚠️ `inactivity_days` must be lower than `kick_days`.")
+        return
+
+    guild_configs[guild.id] = updated
+    save_guild_config(GUILD_CONFIG_PATH, updated)
+    state = guild_states.get(guild.id)
+    if state:
+        state.reconfigure(updated, guild.members)
+        if state.deadlines.is_running():
+            arm_deadlines(state, guild)  # thresholds or tracked roles may have changed
+    else:
+        state = register_guild(updated)
+        load_persisted_activity(state)
+        state.role_index.rebuild(guild.members)
+    if updated.missing():
+        scheduler.remove(guild.id)
+    else:
+        # A newly complete config gets its first scan and deadlines now, not at its check slot
+        schedule_guild(state, guild)
+    await ctx.send(f"✅ `{setting}` updated.", embed=config_embed(updated))
+
+
+async def run_scheduled_check(guild_id: int):
+    state = guild_states.get(guild_id)
+    if state:
+        await check_inactive_members_function(state)
+
+
+# Every configured guild is checked once per CHECK_INTERVAL, spread across the interval
+scheduler = CheckScheduler(run_scheduled_check, CHECK_INTERVAL)
+
+
+@tasks.loop(seconds=ACTIVITY_FLUSH_SECONDS)
+async def flush_activity_task():
+    for state in guild_states.values():
+        state.metrics.set("activity_buffer_size", state.store.pending)
+        try:
+            state.store.flush()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not write activity of guild {state.guild_id}, retrying on the next flush: {e}")
+
+
+def flush_all_activity():
+    """Write every guild's buffered activity; runs on shutdown (Ctrl-C or SIGTERM), even after a crash."""
+    for state in guild_states.values():
+        try:
+            state.store.close()
+        except sqlite3.Error as e:
+            print(f"❌ Lost {state.store.pending} buffered activity updates of guild {state.guild_id}: {e}")
+    activity_db.close()
+
+
+def load_persisted_activity(state: GuildState):
+    if state.loaded:
+        return  # on_ready fires again after reconnects
+    state.loaded = True
+    persisted = state.store.load()
+    for member_id in state.activity:
+        # Keep anything newer that arrived live before on_ready
+        live = state.activity.timestamp(member_id)
+        if live > (persisted.timestamp(member_id) or 0.0):
+            persisted[member_id] = live
+    state.activity = persisted
+    if state.store.has_snapshot():
+        state.ready = True
+        state.progress = 100
+        record_inactivity_bands(state)
+        print(f"📂 Loaded {len(state.activity)} members of guild {state.guild_id} from {ACTIVITY_DB_PATH}")
+    elif state.activity:
+        # Only live activity of a first scan that never finished: everyone else would look never active
+        print(f"📂 Loaded live activity of {len(state.activity)} members of guild {state.guild_id}, waiting for the first full scan")
+
+
+def schedule_guild(state: GuildState, guild: discord.Guild):
+    """
+    Give the guild its weekly check slot and catch up on its activity. A slot
+    that is due right away (the first guild of the process) is a full check
+    that rescans and arms deadlines itself, so there is no separate catch-up.
+    """
+    if scheduler.add(guild.id) > datetime.now(timezone.utc):
+        start_catch_up(state, guild)
+
+
+def start_catch_up(state: GuildState, guild: discord.Guild):
+    """Start `catch_up_activity` unless the guild's deadlines are running or a check holds its lock."""
+    # on_ready fires again after reconnects; deadlines keep running through those
+    if not state.deadlines.is_running() and not state.lock.locked():
+        asyncio.create_task(catch_up_activity(state, guild))
+
+
+async def catch_up_activity(state: GuildState, guild: discord.Guild):
+    """
+    Read what was posted while the bot was offline (or finish the scan it was
+    stopped in), then start acting on member deadlines without waiting for
+    the next full check.
+    """
+    async with state.lock:
+        try:
+            await refresh_activity_cache(state, guild)
+        except Exception as e:
+            # Acting on the old snapshot would miss everything posted while the bot was offline;
+            # deadlines are armed by the next full check (or the next catch-up) instead
+            await report_error_to_staff(state, "Unexpected Error ❌", f"While catching up on activity an unexpected error occured : `{e}`")
+            return
+        arm_deadlines(state, guild)
+
+
+@bot.event
+async def setup_hook():
+    # The persisted caches don't need the gateway, so commands can answer from them as soon as
+    # the bot is connected, while member lists load and the catch-up scans run
+    for state in guild_states.values():
+        load_persisted_activity(state)
+    # systemd stops and restarts the bot with SIGTERM, which bot.run() doesn't handle; closing the
+    # client instead lets it return, so the activity buffers are flushed like after Ctrl-C
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass  # no loop signal handlers on Windows
 
 
 @bot.event
 async def on_ready():
-    print(f"✅ Logged in as {bot.user} (ID: {bot.user.id})")
-    if not check_inactive_members_task.is_running():
-        check_inactive_members_task.start()
+    ready_after = time.monotonic() - STARTED_AT
+    print(f"✅ Logged in as {bot.user} (ID: {bot.user.id}), ready {ready_after:.1f}s after startup")
+    for guild_id, state in guild_states.items():
+        load_persisted_activity(state)
+        if not state.metrics.get("startup_ready_seconds"):
+            state.metrics.set("startup_ready_seconds", ready_after)
+        guild = bot.get_guild(guild_id)
+        if guild:
+            # Small guilds arrive with their members; larger ones are chunked in the background
+            if guild.chunked:
+                state.role_index.rebuild(guild.members)
+            else:
+                asyncio.create_task(ensure_members(state, guild))
+            if not state.config.missing():
+                schedule_guild(state, guild)
+    if not flush_activity_task.is_running():
+        flush_activity_task.start()
+    scheduler.start()
 
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    try:
+        bot.run(TOKEN)
+    finally:
+        flush_all_activity()
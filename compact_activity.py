@@ -0,0 +1,171 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableMapping
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+DAY = 86400.0
+
+Timestamp = Union[datetime, float]
+
+
+def _seconds(when: Timestamp) -> float:
+    return when.timestamp() if isinstance(when, datetime) else float(when)
+
+
+class CompactActivity(MutableMapping):
+    """
+    Activity cache kept in two parallel arrays, member IDs (`array('Q')`,
+    sorted) and last-active epoch seconds (`array('d')`): 16 bytes per member
+    instead of a dict entry, a boxed int and a tz-aware datetime.
+
+    It behaves like the old `Dict[int, datetime]` (values are turned into
+    datetimes on access), but classification should use `timestamp()` to
+    stay in float arithmetic. Band counts and range queries are answered
+    from a time-sorted index with bisection; reports and checks use
+    `split()` to handle members band by band.
+
+    The time index is built on first use. Members written after that are
+    only noted as moved and patched into query results, so live activity
+    doesn't force a rebuild per query; the index is dropped and rebuilt once
+    too many members have moved.
+    """
+
+    def __init__(self, member_ids: Optional[array] = None, times: Optional[array] = None):
+        self._ids = member_ids if member_ids is not None else array("Q")
+        self._times = times if times is not None else array("d")
+        # Member IDs and times ordered by time, built lazily; never changed in place
+        self._time_ids: Optional[array] = None
+        self._time_times: Optional[array] = None
+        self._moved: Set[int] = set()  # members written since the time index was built
+
+    @classmethod
+    def from_mapping(cls, activity: Mapping[int, Timestamp]) -> "CompactActivity":
+        if isinstance(activity, CompactActivity):
+            return cls(array("Q", activity._ids), array("d", activity._times))
+        items = sorted((member_id, _seconds(when)) for member_id, when in activity.items())
+        return cls(array("Q", (member_id for member_id, _ in items)), array("d", (ts for _, ts in items)))
+
+    @classmethod
+    def from_bytes(cls, member_ids: bytes, times: bytes) -> "CompactActivity":
+        """Rebuild from `to_bytes()` output (native byte order, same machine)."""
+        ids, stamps = array("Q"), array("d")
+        ids.frombytes(member_ids)
+        stamps.frombytes(times)
+        return cls(ids, stamps)
+
+    def to_bytes(self) -> Tuple[bytes, bytes]:
+        return self._ids.tobytes(), self._times.tobytes()
+
+    def _position(self, member_id: int) -> int:
+        index = bisect_left(self._ids, member_id)
+        if index < len(self._ids) and self._ids[index] == member_id:
+            return index
+        return -1
+
+    def timestamp(self, member_id: int) -> Optional[float]:
+        ids = self._ids
+        index = bisect_left(ids, member_id)
+        if index < len(ids) and ids[index] == member_id:
+            return self._times[index]
+        return None
+
+    def __getitem__(self, member_id: int) -> datetime:
+        ts = self.timestamp(member_id)
+        if ts is None:
+            raise KeyError(member_id)
+        return datetime.fromtimestamp(ts, timezone.utc)
+
+    def __setitem__(self, member_id: int, when: Timestamp):
+        ts = _seconds(when)
+        index = bisect_left(self._ids, member_id)
+        if index < len(self._ids) and self._ids[index] == member_id:
+            self._times[index] = ts
+        else:
+            self._ids.insert(index, member_id)
+            self._times.insert(index, ts)
+        self._moved_member(member_id)
+
+    def __delitem__(self, member_id: int):
+        index = self._position(member_id)
+        if index < 0:
+            raise KeyError(member_id)
+        del self._ids[index]
+        del self._times[index]
+        self._moved_member(member_id)
+
+    def __contains__(self, member_id) -> bool:
+        return isinstance(member_id, int) and self._position(member_id) >= 0
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _moved_member(self, member_id: int):
+        if self._time_ids is None:
+            return
+        self._moved.add(member_id)
+        if len(self._moved) > max(256, len(self._ids) // 64):
+            self._time_ids = self._time_times = None
+            self._moved.clear()
+
+    def _time_index(self, exact: bool = False) -> Tuple[array, array]:
+        """The time-ordered index; with `exact`, rebuilt first if any member moved."""
+        if self._time_ids is None or (exact and self._moved):
+            order = sorted(range(len(self._ids)), key=self._times.__getitem__)
+            self._time_ids = array("Q", (self._ids[i] for i in order))
+            self._time_times = array("d", (self._times[i] for i in order))
+            self._moved.clear()
+        return self._time_ids, self._time_times
+
+    def _by_time(self) -> array:
+        return self._time_index(exact=True)[1]
+
+    def between(self, after: float, until: float) -> List[Tuple[int, float]]:
+        """(member ID, last active) of everyone last active in (`after`, `until`], oldest first."""
+        ids, times = self._time_index()
+        lo, hi = bisect_right(times, after), bisect_right(times, until)
+        if not self._moved:
+            return list(zip(ids[lo:hi], times[lo:hi]))
+        moved = self._moved
+        found = [(member_id, ts) for member_id, ts in zip(ids[lo:hi], times[lo:hi]) if member_id not in moved]
+        patched = []
+        for member_id in moved:
+            ts = self.timestamp(member_id)
+            if ts is not None and after < ts <= until:
+                patched.append((member_id, ts))
+        if not patched:
+            return found
+        patched.sort(key=itemgetter(1))
+        return list(heapq.merge(found, patched, key=itemgetter(1)))
+
+    def inactive_between(self, now: float, min_days: int, max_days: int) -> List[Tuple[int, float]]:
+        """Members last active between `min_days` and `max_days` (whole days) ago, most inactive first."""
+        return self.between(now - (max_days + 1) * DAY, now - min_days * DAY)
+
+    def split(self, cutoffs: Iterable[float]) -> List[Tuple[array, array]]:
+        """
+        Member IDs and last-active times cut out of the time index at each
+        cutoff (epoch seconds, ascending): everyone last active up to the first
+        cutoff, then up to the next one, ... and after the last one, oldest
+        first. Cutting is two bisections and a copy per band, so callers can
+        skip a whole band without looking at its members.
+        """
+        ids, times = self._time_index(exact=True)
+        bounds = [0, *(bisect_right(times, cutoff) for cutoff in cutoffs), len(times)]
+        return [(ids[lo:hi], times[lo:hi]) for lo, hi in zip(bounds, bounds[1:])]
+
+    def bucket_counts(self, now: float, thresholds_days: Iterable[int]) -> List[int]:
+        """
+        Members per inactivity band: [0, t1) days, [t1, t2) days, ... and
+        [tn, ∞) days, for the thresholds in ascending order.
+        """
+        by_time = self._by_time()
+        # Members inactive for at least each threshold; shrinks as thresholds grow
+        reached = [bisect_right(by_time, now - days * DAY) for days in sorted(thresholds_days)]
+        bounds = [len(by_time), *reached, 0]
+        return [bounds[i] - bounds[i + 1] for i in range(len(bounds) - 1)]
@@ -0,0 +1,97 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+class DeadlineQueue:
+    """
+    Per-member deadlines (Unix timestamps) in a min-heap, with one background
+    task that sleeps until the earliest one and hands the members that are due
+    to `job`. Rescheduling a member pushes a new entry and the superseded one
+    is dropped when it reaches the top; the heap is rebuilt once such stale
+    entries outnumber the live ones.
+    """
+
+    def __init__(self):
+        self.due: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._job: Optional[Callable[[List[int]], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.due)
+
+    def schedule(self, member_id: int, due: float):
+        if self.due.get(member_id) == due:
+            return
+        self.due[member_id] = due
+        heapq.heappush(self._heap, (due, member_id))
+        if len(self._heap) > 2 * len(self.due) + 64:
+            self._heap = [(when, member_id) for member_id, when in self.due.items()]
+            heapq.heapify(self._heap)
+        if self._heap[0][0] == due:
+            self._changed.set()  # earlier than what the loop is sleeping for
+
+    def discard(self, member_id: int):
+        self.due.pop(member_id, None)
+
+    def clear(self):
+        self.due.clear()
+        self._heap.clear()
+
+    def _drop_stale(self):
+        while self._heap and self.due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[int]:
+        """Remove and return every member whose deadline is at or before `now`."""
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, member_id = heapq.heappop(self._heap)
+            del self.due[member_id]
+            due.append(member_id)
+            self._drop_stale()
+        return due
+
+    def start(self, job: Callable[[List[int]], Awaitable[None]]):
+        self._job = job
+        if not self.is_running():
+            self._task = asyncio.create_task(self._loop())
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None  # stopped right away, so a `start()` in the same tick starts over
+
+    async def _loop(self):
+        while True:
+            self._changed.clear()
+            due = self.pop_due(time.time())
+            if due:
+                task = asyncio.create_task(self._run(due))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            next_due = self.next_due()
+            timeout = max(0.0, next_due - time.time()) if next_due is not None else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, member_ids: List[int]):
+        try:
+            await self._job(member_ids)
+        except Exception as e:
+            print(f"❌ Processing {len(member_ids)} member deadlines failed: {e}")
@@ -0,0 +1,104 @@
+import csv
+import gzip
+import discord
+from datetime import datetime
+from io import BytesIO, StringIO
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+CSV_HEADER = ["User ID", "Display Name", "Last Active (UTC)", "Days Ago", "Joined At (UTC)", "Roles"]
+
+# gzip keeps some compressed data in its own buffers, so cut parts a bit early
+PART_SIZE_MARGIN = 256 * 1024
+
+
+def activity_rows(
+    members: Iterable[discord.Member],
+    activity: Dict[int, datetime],
+    now: datetime,
+    role: Optional[discord.Role] = None,
+    min_days: Optional[int] = None,
+    max_days: Optional[int] = None,
+) -> Iterator[List[str]]:
+    """
+    Yield one CSV row per human member. Filters are applied before a row is
+    formatted; with a day range, members without known activity are left out.
+    """
+    for member in members:
+        if member.bot:
+            continue  # Skip bots
+        if role is not None and role not in member.roles:
+            continue
+
+        last_seen = activity.get(member.id)
+        days_ago = (now - last_seen).days if last_seen else None
+        if min_days is not None or max_days is not None:
+            if days_ago is None:
+                continue
+            if min_days is not None and days_ago < min_days:
+                continue
+            if max_days is not None and days_ago > max_days:
+                continue
+
+        joined_at = member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else "Unknown"
+        roles = "; ".join(r.name for r in member.roles if r.name != "@everyone")
+
+        if last_seen:
+            last_seen_str = last_seen.strftime('%Y-%m-%d %H:%M:%S')
+            days_ago_str = str(days_ago)
+        else:
+            last_seen_str = "Never"
+            days_ago_str = "Not in cache"
+
+        yield [str(member.id), member.display_name, last_seen_str, days_ago_str, joined_at, roles]
+
+
+def gzip_csv_parts(
+    rows: Iterable[List[str]],
+    max_bytes: int,
+    header: List[str] = CSV_HEADER,
+) -> Iterator[Tuple[BytesIO, int]]:
+    """
+    Compress rows into gzip'd CSV files as they are produced and start a new
+    file (with its own header) before one grows past `max_bytes`. Yields each
+    finished file, rewound, with the number of rows in it. Only the part being
+    written is held in memory.
+    """
+    cutoff = max(max_bytes - PART_SIZE_MARGIN, max_bytes // 2)
+    line = StringIO()
+    writer = csv.writer(line)
+
+    def encode(row) -> bytes:
+        writer.writerow(row)
+        data = line.getvalue().encode("utf-8")
+        line.seek(0)
+        line.truncate()
+        return data
+
+    encoded_header = encode(header)
+    buffer, archive, count = None, None, 0
+
+    for row in rows:
+        if archive is None:
+            buffer = BytesIO()
+            archive = gzip.GzipFile(fileobj=buffer, mode="wb")
+            archive.write(encoded_header)
+            count = 0
+
+        archive.write(encode(row))
+        count += 1
+
+        if buffer.tell() >= cutoff:
+            archive.close()
+            buffer.seek(0)
+            yield buffer, count
+            buffer, archive = None, None
+
+    if archive is None and buffer is None and count == 0:
+        # No rows at all: still hand out a file with just the header
+        buffer = BytesIO()
+        archive = gzip.GzipFile(fileobj=buffer, mode="wb")
+        archive.write(encoded_header)
+    if archive is not None:
+        archive.close()
+        buffer.seek(0)
+        yield buffer, count
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import sqlite3
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional, Set
+
+from activity_store import ActivityStore
+from compact_activity import CompactActivity
+from deadlines import DeadlineQueue
+from metrics import Metrics
+from role_index import RoleIndex
+
+
+@dataclass
+class GuildConfig:
+    """Roles, channels and thresholds the bot uses in one guild."""
+    guild_id: int
+    cleaner_role_id: int = 0
+    soldier_role_id: int = 0
+    general_role_id: int = 0  # may run commands and is named (not pinged) in restore notices
+    exempt_role_ids: List[int] = field(default_factory=list)
+    warning_channel_id: int = 0
+    staff_channel_id: int = 0
+    inactivity_days: int = 90
+    kick_days: int = 180
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GuildConfig":
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def missing(self) -> List[str]:
+        """Settings that must be set before the inactivity check may touch anyone."""
+        required = ("cleaner_role_id", "soldier_role_id", "general_role_id", "warning_channel_id", "staff_channel_id")
+        return [name[:-len("_id")] for name in required if not getattr(self, name)]
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    """The shard whose gateway connection receives this guild's events."""
+    return (guild_id >> 22) % shard_count
+
+
+def load_guild_configs(path: str) -> Dict[int, GuildConfig]:
+    """Configs by guild ID from a JSON list; an empty dict if the file doesn't exist yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        configs = [GuildConfig.from_dict(entry) for entry in json.load(f)]
+    return {config.guild_id: config for config in configs}
+
+
+def save_guild_config(path: str, config: GuildConfig):
+    """
+    Write one guild's config. The file is re-read first so that entries
+    written by other bot processes (other shards) are kept.
+    """
+    configs = load_guild_configs(path)
+    configs[config.guild_id] = config
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([asdict(entry) for _, entry in sorted(configs.items())], f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class GuildState:
+    """
+    Everything the bot keeps per guild: its config, activity cache and store
+    namespace, role index, metrics and the lock that keeps two inactivity
+    checks of the same guild from overlapping.
+    """
+
+    def __init__(
+        self,
+        config: GuildConfig,
+        db_path: str,
+        conn: Optional[sqlite3.Connection] = None,
+        max_pending: int = 5000,
+    ):
+        self.config = config
+        self.metrics = Metrics(guild=config.guild_id)
+        self.store = ActivityStore(db_path, config.guild_id, conn, max_pending, self.metrics)
+        self.role_index = RoleIndex(config.cleaner_role_id, config.soldier_role_id, config.exempt_role_ids)
+        self.lock = asyncio.Lock()
+        # Next threshold crossing per member, so demotions, kicks and restores happen when due
+        # instead of waiting for the next full check
+        self.deadlines = DeadlineQueue()
+        self.acting: Set[int] = set()  # members with an action being applied right now
+        self.failed: Set[int] = set()  # members whose action failed, left to the next full check
+        self.demoted_at: Dict[int, float] = {}  # members demoted by this process, for the kick notice
+
+        # Rescans build the next snapshot separately and swap it in at once, so the
+        # cache is always readable and live updates keep landing in it during a scan
+        self.activity = CompactActivity()
+        self.ready = False  # True once a complete snapshot (scanned or persisted) is served
+        self.scanning = False
+        self.progress = 0  # 0 to 100, by channels done
+        self.scan_channels = (0, 0)  # channels done, channels to scan
+        self.scan_messages = 0  # history messages read by the current scan, including before a resume
+        self.version = 0  # bumped every time a new snapshot is swapped in
+        self.loaded = False  # persisted activity was read
+
+    @property
+    def guild_id(self) -> int:
+        return self.config.guild_id
+
+    def scan_status(self) -> str:
+        done, total = self.scan_channels
+        return f"{self.progress}% ({done}/{total} channels, {self.scan_messages:,} messages)"
+
+    def reconfigure(self, config: GuildConfig, members: Optional[list] = None):
+        """Apply a changed config; the role index follows the new role IDs."""
+        self.config = config
+        self.role_index = RoleIndex(config.cleaner_role_id, config.soldier_role_id, config.exempt_role_ids)
+        if members is not None:
+            self.role_index.rebuild(members)
@@ -0,0 +1,52 @@
+"""
+Runs the bot as several processes, each owning a share of the shards, so
+event handling and scans of a large bot spread over several CPU cores. All
+processes use the same ACTIVITY_DB_PATH and GUILD_CONFIG_PATH.
+
+    python launcher.py --shards 8 --processes 4
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+
+def shard_groups(shards: int, processes: int) -> List[List[int]]:
+    """Split shard IDs 0..shards-1 into `processes` groups of near-equal size."""
+    return [list(range(start, shards, processes)) for start in range(min(processes, shards))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, required=True, help="total shard count")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    bot_path = Path(__file__).resolve().parent / "bot.py"
+    children = []
+    for shard_ids in shard_groups(args.shards, args.processes):
+        env = dict(os.environ, SHARD_COUNT=str(args.shards), SHARD_IDS=",".join(map(str, shard_ids)))
+        children.append(subprocess.Popen([sys.executable, str(bot_path)], env=env))
+        print(f"🚀 Started shards {shard_ids} (pid {children[-1].pid})")
+
+    def stop(signum, frame):
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # If one process dies, stop the rest so a supervisor (e.g. systemd) restarts the whole set
+    while all(child.poll() is None for child in children):
+        time.sleep(1)
+    stop(None, None)
+    sys.exit(max(child.wait() for child in children))
+
+
+if __name__ == "__main__":
+    main()
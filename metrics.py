@@ -0,0 +1,125 @@
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class ChannelStats:
+    name: str
+    messages: int = 0
+    pages: int = 0
+    seconds: float = 0.0
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Counters, last phase durations and per-channel stats of the latest scan.
+    Everything is plain in-process state; `render_prometheus()` turns one or
+    more registries into the Prometheus text format for a textfile collector
+    or scraper. Constant labels (e.g. the guild) are added to every sample.
+    """
+
+    def __init__(self, prefix: str = "cleaner_bot", **labels):
+        self.prefix = prefix
+        self.labels = labels
+        self.counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.phases: Dict[str, float] = {}  # last duration per phase, seconds
+        self.channels: Dict[int, ChannelStats] = {}  # latest scan only
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        self.counters[(name, _labels(labels))] += value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[(name, _labels(labels))] = value
+
+    def get(self, name: str, **labels) -> float:
+        key = (name, _labels(labels))
+        return self.counters.get(key, self.gauges.get(key, 0.0))
+
+    def total(self, name: str) -> float:
+        """Sum of a counter over all label combinations."""
+        return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    @contextmanager
+    def timed(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[phase] = elapsed
+            self.inc("phase_seconds_total", elapsed, phase=phase)
+            self.set("phase_last_seconds", elapsed, phase=phase)
+
+    def start_scan(self):
+        self.channels.clear()
+
+    def record_channel(self, channel_id: int, name: str, messages: int, pages: int, seconds: float):
+        self.channels[channel_id] = ChannelStats(name, messages, pages, seconds)
+        self.inc("history_messages_total", messages)
+        self.inc("history_pages_total", pages)
+        self.inc("rest_calls_total", pages, kind="history")
+
+    def slowest_channels(self, count: int = 10) -> List[Tuple[int, ChannelStats]]:
+        return sorted(self.channels.items(), key=lambda item: item[1].seconds, reverse=True)[:count]
+
+    def samples(self) -> Iterator[Tuple[str, str, Labels, float]]:
+        """(kind, full name, labels, value) of every sample, constant labels included."""
+        for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+            for (name, labels), value in values.items():
+                yield kind, f"{self.prefix}_{name}", _labels({**self.labels, **dict(labels)}), value
+
+        channel_metrics = (
+            ("channel_messages", lambda stats: stats.messages),
+            ("channel_pages", lambda stats: stats.pages),
+            ("channel_scan_seconds", lambda stats: stats.seconds),
+        )
+        for name, value_of in channel_metrics:
+            for channel_id, stats in self.channels.items():
+                labels = _labels({**self.labels, "channel": stats.name, "channel_id": channel_id})
+                yield "gauge", f"{self.prefix}_{name}", labels, value_of(stats)
+
+
+def render_prometheus(registries: Iterable[Metrics]) -> str:
+    """One Prometheus text document for several registries, one TYPE line per metric."""
+    kinds: Dict[str, str] = {}
+    samples: Dict[str, List[Tuple[Labels, float]]] = defaultdict(list)
+    for registry in registries:
+        for kind, name, labels, value in registry.samples():
+            kinds.setdefault(name, kind)
+            samples[name].append((labels, value))
+
+    lines = []
+    for name in sorted(samples):
+        lines.append(f"# TYPE {name} {kinds[name]}")
+        for labels, value in sorted(samples[name]):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_prometheus(path: str, registries: Iterable[Metrics]):
+    """Write the Prometheus text atomically, so a collector never reads half a file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus(registries))
+    os.replace(tmp_path, path)
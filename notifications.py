@@ -0,0 +1,96 @@
+import discord
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_CONTENT_LIMIT = 2000
+
+
+def paginate_lines(lines: Iterable[str], limit: int) -> Iterator[str]:
+    """
+    Join lines into pages of at most `limit` characters without splitting a
+    line. Pages are produced as the lines come in, and blank lines at a page
+    boundary are dropped.
+    """
+    current = ""
+    for line in lines:
+        if len(line) > limit:
+            line = line[:limit - 1] + "…"
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            yield current.rstrip()
+            candidate = line
+        current = candidate
+    if current.strip():
+        yield current.rstrip()
+
+
+class DigestBatcher:
+    """
+    Collects notifications during a run and sends them as a few digest embeds
+    instead of one message per event. Lines are grouped by section and paged
+    to stay within Discord's embed description limit.
+
+    Embeds never ping anyone, so members who must be notified are collected
+    separately and mentioned in plain messages (as many per message as fit).
+    Only those members are pinged; roles named in the text are not.
+    """
+
+    def __init__(self, title: str, color=discord.Color.orange()):
+        self.title = title
+        self.color = color
+        self.sections: Dict[str, List[str]] = {}
+        self.mentions: Dict[Tuple[str, str], List[str]] = {}
+
+    def __len__(self):
+        return sum(len(lines) for lines in self.sections.values())
+
+    def add(self, section: str, line: str, mention: Optional[str] = None, mention_text: Tuple[str, str] = ("", "")):
+        """
+        Queue a line under `section`. If `mention` is given it is delivered in a
+        message reading `prefix <mentions> suffix` from `mention_text`.
+        """
+        self.sections.setdefault(section, []).append(line)
+        if mention:
+            self.mentions.setdefault(mention_text, []).append(mention)
+
+    def embeds(self) -> List[discord.Embed]:
+        lines: List[str] = []
+        for section, entries in self.sections.items():
+            if lines:
+                lines.append("")
+            lines.append(f"**{section} ({len(entries)}):**")
+            lines.extend(f"• {entry}" for entry in entries)
+
+        pages = list(paginate_lines(lines, EMBED_DESCRIPTION_LIMIT))
+        embeds = []
+        for number, page in enumerate(pages, start=1):
+            title = self.title if len(pages) == 1 else f"{self.title} ({number}/{len(pages)})"
+            embeds.append(discord.Embed(title=title, description=page, color=self.color))
+        return embeds
+
+    def mention_messages(self) -> List[str]:
+        messages: List[str] = []
+        for (prefix, suffix), mentions in self.mentions.items():
+            budget = MESSAGE_CONTENT_LIMIT - len(prefix) - len(suffix)
+            for chunk in paginate_lines(mentions, budget):
+                messages.append(f"{prefix}{chunk.replace(chr(10), ' ')}{suffix}")
+        return messages
+
+    async def flush(self, channel) -> int:
+        """Send everything queued to `channel` and start over. Returns the number of messages sent."""
+        if channel is None:
+            if self.sections:
+                print(f"⚠️ No channel to deliver '{self.title}' ({len(self)} entries)")
+            self.sections.clear()
+            self.mentions.clear()
+            return 0
+
+        messages, embeds = self.mention_messages(), self.embeds()
+        self.sections.clear()
+        self.mentions.clear()
+
+        for content in messages:
+            await channel.send(content, allowed_mentions=discord.AllowedMentions(users=True, roles=False))
+        for embed in embeds:
+            await channel.send(embed=embed)
+        return len(messages) + len(embeds)
@@ -0,0 +1,105 @@
+import discord
+from typing import Awaitable, Callable, Dict, Iterator, List
+
+from actions import DEMOTE, KICK, RESTORE, PlannedAction
+from notifications import EMBED_DESCRIPTION_LIMIT, paginate_lines
+from report import ReportPaginator
+
+# Render order, headings and summary labels of a plan diff
+DIFF_TITLES = {
+    DEMOTE: "➖ To demote to Cleaner",
+    RESTORE: "➕ To restore (Cleaner removed)",
+    KICK: "🚫 To kick",
+}
+DIFF_LABELS = {DEMOTE: "demote", RESTORE: "restore", KICK: "kick"}
+
+
+def plan_counts(plan: List[PlannedAction]) -> Dict[str, int]:
+    counts = {kind: 0 for kind in DIFF_TITLES}
+    for action in plan:
+        counts[action.kind] += 1
+    return counts
+
+
+def diff_line(action: PlannedAction) -> str:
+    name = f"• `{action.member.display_name}`"
+    if action.never_active:
+        return f"{name} — never active, joined {action.days} days ago"
+    if action.kind == DEMOTE:
+        removed = ", ".join(role.name for role in action.removed_roles) or "no other roles"
+        return f"{name} — {action.days} days inactive, loses {removed}"
+    if action.kind == RESTORE:
+        return f"{name} — active {action.days} days ago"
+    return f"{name} — {action.days} days inactive"
+
+
+def plan_diff_lines(plan: List[PlannedAction]) -> Iterator[str]:
+    counts = plan_counts(plan)
+    yield "**Planned: " + " · ".join(f"{count} {DIFF_LABELS[kind]}" for kind, count in counts.items()) + "**"
+    for kind, title in DIFF_TITLES.items():
+        actions = sorted((a for a in plan if a.kind == kind), key=lambda a: (-a.days, a.member.display_name))
+        if not actions:
+            continue
+        yield ""
+        yield f"**{title} ({len(actions)}):**"
+        for action in actions:
+            yield diff_line(action)
+
+
+def plan_diff_pages(plan: List[PlannedAction], limit: int = EMBED_DESCRIPTION_LIMIT) -> Iterator[str]:
+    return paginate_lines(plan_diff_lines(plan), limit)
+
+
+class PlanApprovalView(ReportPaginator):
+    """
+    A plan diff with paging plus Approve/Discard buttons. Approving runs
+    `on_approve` once, which applies the previewed plan (minus whatever
+    changed since); the buttons expire with the view so an old preview can't
+    be executed later.
+    """
+
+    def __init__(
+        self,
+        pages: Iterator[str],
+        title: str,
+        author_id: int,
+        on_approve: Callable[[discord.Interaction], Awaitable[str]],
+        can_approve: Callable[[discord.abc.User], bool],
+        timeout: float = 900,
+    ):
+        super().__init__(pages, title, author_id, color=discord.Color.gold(), timeout=timeout)
+        self.on_approve = on_approve
+        self.can_approve = can_approve
+        self.message = None  # set by the caller, for disabling the buttons on timeout
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id or self.can_approve(interaction.user)
+
+    def _final_embed(self, footer: str) -> discord.Embed:
+        embed = self.embed()  # also re-enables the paging buttons, so disable afterwards
+        for item in self.children:
+            item.disabled = True
+        embed.set_footer(text=footer)
+        return embed
+
+    @discord.ui.button(label="✅ Approve & run", style=discord.ButtonStyle.danger, row=1)
+    async def approve(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        who = interaction.user.display_name
+        await interaction.response.edit_message(embed=self._final_embed(f"⏳ Approved by {who}, running..."), view=self)
+        result = await self.on_approve(interaction)
+        await interaction.edit_original_response(embed=self._final_embed(f"Approved by {who} · {result}"), view=self)
+
+    @discord.ui.button(label="✖ Discard", style=discord.ButtonStyle.secondary, row=1)
+    async def discard(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        embed = self._final_embed(f"Discarded by {interaction.user.display_name}, nothing was changed.")
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(embed=self._final_embed("Plan expired, run `!run_inactivity_check dry` again."), view=self)
+        except discord.HTTPException:
+            pass
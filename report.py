@@ -0,0 +1,232 @@
+import discord
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from compact_activity import DAY, CompactActivity
+from notifications import EMBED_DESCRIPTION_LIMIT, paginate_lines
+from role_index import RoleIndex
+
+SOON_DAYS = 14  # "nearing" window before a Cleaner assignment or kick
+
+ACTIVE = "active"
+NEARING_INACTIVE = "nearing_inactive"
+OVERDUE_CLEANER = "overdue_cleaner"
+CLEANER = "cleaner"
+CLEANER_SOON_KICK = "cleaner_soon_kick"
+CLEANER_OVERDUE_KICK = "cleaner_overdue_kick"
+UNCACHED = "uncached"
+
+# Render order and headings
+SECTION_TITLES = {
+    ACTIVE: "✅ Active Members",
+    NEARING_INACTIVE: "⚠️ Members nearing inactivity (Cleaner role)",
+    OVERDUE_CLEANER: "⏳ Members overdue for Cleaner role",
+    CLEANER: "🧹 Cleaners (not yet close to kick)",
+    CLEANER_SOON_KICK: f"❗ Cleaners close to being kicked (≤{SOON_DAYS} days)",
+    CLEANER_OVERDUE_KICK: "🔥 Cleaners overdue for kick",
+    UNCACHED: "⚠️ Members not yet analyzed (no messages seen)",
+}
+
+# How each section describes its day count
+TEMPLATES = {
+    ACTIVE: "{days} days ago",
+    NEARING_INACTIVE: "{days} days ahead",
+    OVERDUE_CLEANER: "{days} days overdue",
+    CLEANER: "{days} days ahead",
+    CLEANER_SOON_KICK: "{days} days ahead",
+    CLEANER_OVERDUE_KICK: "{days} days overdue",
+    UNCACHED: "",
+}
+
+
+class ReportEntry(NamedTuple):
+    days: int  # sort key
+    name: str
+    template: str  # formatted with `days`; empty for name-only entries
+
+    def render(self) -> str:
+        if not self.template:
+            return f"• `{self.name}`"
+        return f"• `{self.name}` — {self.template.format(days=self.days)}"
+
+
+@dataclass
+class InactivityReport:
+    minimal: bool
+    total_count: int = 0  # members analyzed (excluding bots & exempt)
+    sections: Dict[str, List[ReportEntry]] = field(default_factory=lambda: {key: [] for key in SECTION_TITLES})
+
+    @property
+    def listed_count(self) -> int:
+        return sum(len(entries) for entries in self.sections.values())
+
+
+def classify_member(
+    days_since: Optional[int],
+    days_since_join: int,
+    is_cleaner: bool,
+    minimal: bool,
+    inactivity_days: int,
+    kick_days: int,
+):
+    """
+    Return the (section, days) a member belongs to in the report, or None if
+    not listed. `days_since` is None for members without known activity.
+    """
+    if days_since is None:
+        if days_since_join >= inactivity_days and not is_cleaner:
+            return OVERDUE_CLEANER, days_since_join
+        if not minimal:
+            return UNCACHED, 0
+        return None
+
+    if is_cleaner:
+        kick_in_days = kick_days - days_since
+        if kick_in_days <= 0:
+            return CLEANER_OVERDUE_KICK, -kick_in_days
+        if kick_in_days <= SOON_DAYS:
+            return CLEANER_SOON_KICK, kick_in_days
+        return CLEANER, kick_in_days
+
+    cleaner_in_days = inactivity_days - days_since
+    if cleaner_in_days < 0:
+        return OVERDUE_CLEANER, -cleaner_in_days
+    if cleaner_in_days <= SOON_DAYS:
+        return NEARING_INACTIVE, cleaner_in_days
+    if not minimal:
+        return ACTIVE, days_since
+    return None
+
+
+def build_report(
+    members: Iterable[discord.Member],
+    activity: CompactActivity,
+    now: datetime,
+    minimal: bool,
+    role_index: RoleIndex,
+    inactivity_days: int,
+    kick_days: int,
+) -> InactivityReport:
+    """
+    Classify every member once into typed records and sort each section on its
+    numeric key. Members are taken band by band from the activity time index:
+    everyone who isn't yet near the Cleaner threshold is one band, which a
+    minimal report only looks into for Cleaners.
+    """
+    report = InactivityReport(minimal=minimal)
+    now_ts = now.timestamp()
+    analyzed = {
+        member.id: member for member in members if not member.bot and not role_index.is_exempt(member.id)
+    }
+    report.total_count = len(analyzed)
+
+    def place(member: discord.Member, days_since: Optional[int]):
+        days_since_join = int((now_ts - (member.joined_at or now).timestamp()) // DAY)
+        placement = classify_member(
+            days_since, days_since_join, role_index.is_cleaner(member.id),
+            minimal, inactivity_days, kick_days,
+        )
+        if placement is None:
+            return
+        section, days = placement
+        template = TEMPLATES[section]
+        if section == OVERDUE_CLEANER and days_since is None:
+            template = "{days} days ago joined, never active"
+        report.sections[section].append(ReportEntry(days, member.display_name, template))
+
+    (near_ids, near_times), (recent_ids, recent_times) = activity.split([now_ts - (inactivity_days - SOON_DAYS) * DAY])
+    recent = set()
+    if minimal:
+        # Recently active members are only listed if they are Cleaners (counting down to the kick)
+        recent = set(recent_ids)
+        recent_members = ((member_id, activity.timestamp(member_id)) for member_id in role_index.cleaners if member_id in recent)
+    else:
+        recent_members = zip(recent_ids, recent_times)
+    for member_id, ts in chain(zip(near_ids, near_times), recent_members):
+        member = analyzed.pop(member_id, None)
+        if member is not None:
+            place(member, int((now_ts - ts) // DAY))
+
+    # Whoever is left has no known activity (or, in a minimal report, is recently active)
+    for member_id, member in analyzed.items():
+        if member_id not in recent:
+            place(member, None)
+
+    for section, entries in report.sections.items():
+        if section != UNCACHED:  # listed in member order, like before
+            entries.sort()
+    return report
+
+
+def report_lines(report: InactivityReport) -> Iterator[str]:
+    for section, title in SECTION_TITLES.items():
+        entries = report.sections[section]
+        if not entries:
+            continue
+        yield ""
+        yield f"**{title} ({len(entries)}):**"
+        for entry in entries:
+            yield entry.render()
+    yield ""
+    yield f"**👥 Members displayed: `{report.listed_count}` / Analyzed (excluding bots & exempt): `{report.total_count}`**"
+
+
+def report_pages(report: InactivityReport, limit: int = EMBED_DESCRIPTION_LIMIT) -> Iterator[str]:
+    """Stream the report as description-sized pages; only one page is held at a time."""
+    return paginate_lines(report_lines(report), limit)
+
+
+class ReportPaginator(discord.ui.View):
+    """
+    Previous/next buttons over a page stream. Pages are rendered lazily the
+    first time they are reached, so large reports are never built at once.
+    """
+
+    def __init__(self, pages: Iterator[str], title: str, author_id: int, color=discord.Color.blurple(), timeout: float = 600):
+        super().__init__(timeout=timeout)
+        self.title = title
+        self.color = color
+        self.author_id = author_id
+        self._pages = pages
+        self._rendered: List[str] = []
+        self._exhausted = False
+        self.index = 0
+        self._fill(2)  # current page and whether there is a next one
+
+    def _fill(self, count: int):
+        while not self._exhausted and len(self._rendered) < count:
+            page = next(self._pages, None)
+            if page is None:
+                self._exhausted = True
+            else:
+                self._rendered.append(page)
+
+    @property
+    def single_page(self) -> bool:
+        return self._exhausted and len(self._rendered) <= 1
+
+    def embed(self) -> discord.Embed:
+        description = self._rendered[self.index] if self._rendered else "✅ All members are active or not near cleanup thresholds."
+        embed = discord.Embed(title=self.title, description=description, color=self.color)
+        if not self.single_page:
+            total = f"/{len(self._rendered)}" if self._exhausted else ""
+            embed.set_footer(text=f"Page {self.index + 1}{total}")
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.index + 1 >= len(self._rendered)
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.index = max(0, self.index - 1)
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self._fill(self.index + 3)
+        self.index = min(self.index + 1, len(self._rendered) - 1)
+        await interaction.response.edit_message(embed=self.embed(), view=self)
@@ -0,0 +1,62 @@
+import discord
+from typing import Dict, Iterable, Set
+
+
+class RoleIndex:
+    """
+    Member IDs per tracked role (Cleaner, Soldier, exempt roles), kept current
+    from gateway member events so classification is a set lookup instead of
+    a scan over `member.roles`. Reports and the inactivity check share it.
+    """
+
+    def __init__(self, cleaner_role_id: int, soldier_role_id: int, exempt_role_ids: Iterable[int]):
+        self.cleaner_role_id = cleaner_role_id
+        self.soldier_role_id = soldier_role_id
+        self.exempt_role_ids = frozenset(exempt_role_ids)
+        self.by_role: Dict[int, Set[int]] = {
+            role_id: set() for role_id in (cleaner_role_id, soldier_role_id, *self.exempt_role_ids)
+        }
+        self.exempt: Set[int] = set()
+        self.bots: Set[int] = set()
+
+    def rebuild(self, members: Iterable[discord.Member]):
+        for member_ids in self.by_role.values():
+            member_ids.clear()
+        self.exempt.clear()
+        self.bots.clear()
+        for member in members:
+            self.update_member(member)
+
+    def update_member(self, member: discord.Member):
+        self.set_roles(member.id, member.roles)
+        if member.bot:
+            self.bots.add(member.id)
+
+    def set_roles(self, member_id: int, roles: Iterable[discord.Role]):
+        """Replace the member's tracked roles, e.g. right after the bot changed them."""
+        is_bot = member_id in self.bots
+        self.remove_member(member_id)
+        if is_bot:
+            self.bots.add(member_id)
+        for role in roles:
+            member_ids = self.by_role.get(role.id)
+            if member_ids is not None:
+                member_ids.add(member_id)
+                if role.id in self.exempt_role_ids:
+                    self.exempt.add(member_id)
+
+    def remove_member(self, member_id: int):
+        for member_ids in self.by_role.values():
+            member_ids.discard(member_id)
+        self.exempt.discard(member_id)
+        self.bots.discard(member_id)
+
+    @property
+    def cleaners(self) -> Set[int]:
+        return self.by_role[self.cleaner_role_id]
+
+    def is_cleaner(self, member_id: int) -> bool:
+        return member_id in self.by_role[self.cleaner_role_id]
+
+    def is_exempt(self, member_id: int) -> bool:
+        return member_id in self.exempt
@@ -0,0 +1,384 @@
+import asyncio
+import heapq
+import time
+import discord
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from discord.utils import snowflake_time, time_snowflake
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import Metrics
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+HISTORY_PAGE_SIZE = 100  # messages per GET /channels/{id}/messages call
+THREAD_LIST_PAGE_SIZE = 100  # threads per GET /channels/{id}/threads/archived/public call
+CHECKPOINT_PAGES = 10  # history pages between checkpoints of a long channel walk
+
+
+@dataclass
+class ChannelProgress:
+    """Where the walk of one channel stands, so an interrupted scan can resume it."""
+    after_id: int  # lower bound of the walk (watermark or lookback), fixed for the whole scan
+    newest_id: Optional[int] = None  # newest message seen; becomes the channel's watermark
+    cursor_id: Optional[int] = None  # oldest message read so far; a resumed walk continues below it
+    messages: int = 0
+    done: bool = False
+
+
+# Called with the channel, its progress and the authors folded in since the previous checkpoint
+CheckpointCallback = Callable[[object, ChannelProgress, Dict[int, datetime]], None]
+
+
+class RequestPacer:
+    """
+    Token bucket shared by all scan workers so that parallel channel walks stay
+    under Discord's global request limit. Per-route buckets are already handled
+    by discord.py from the X-RateLimit headers, and every history route is its
+    own bucket, so one worker per channel never contends on them.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        # A small burst keeps any one-second window at roughly `rate + burst` calls
+        self.capacity = burst or max(1, int(rate // 4))
+        self.tokens = float(self.capacity)
+        self.waited = 0.0  # seconds spent waiting for a token
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self.tokens = 1.0
+                self._updated = loop.time()
+
+            self.tokens -= 1
+
+
+def is_scannable(channel, guild: discord.Guild) -> bool:
+    """The bot can read it and it has ever seen a message."""
+    return channel.permissions_for(guild.me).read_messages and channel.last_message_id is not None
+
+
+def readable_text_channels(guild: discord.Guild):
+    """Text channels and the text chat of voice channels the bot can read."""
+    for channel in [*guild.text_channels, *guild.voice_channels]:
+        if is_scannable(channel, guild):
+            yield channel
+
+
+async def readable_threads(
+    guild: discord.Guild,
+    since: Optional[datetime] = None,
+    pacer: Optional[RequestPacer] = None,
+    metrics: Optional[Metrics] = None,
+    archive_marks: Optional[Dict[int, datetime]] = None,
+) -> List[discord.Thread]:
+    """
+    Threads and forum posts worth scanning: the active ones from the gateway
+    cache (no request needed), plus public archived ones that were archived
+    after `since`. Archived threads are listed newest first, so the listing
+    of a parent stops at the first one archived before `since`. Listing
+    pages go through `pacer` like history pages do.
+
+    `archive_marks` (parent ID -> when its archive was last listed) narrows
+    each listing to threads archived since then: older ones were listed (and
+    scanned) before, and an archived thread gets no new messages. The dict
+    is advanced in place.
+    """
+    threads = {thread.id: thread for thread in guild.threads if is_scannable(thread, guild)}
+
+    async def request_page():
+        if pacer:
+            await pacer.acquire()
+        if metrics:
+            metrics.inc("rest_calls_total", kind="archived_threads")
+
+    for parent in [*guild.text_channels, *guild.forums]:
+        if not parent.permissions_for(guild.me).read_message_history:
+            continue
+        cutoff = since
+        mark = archive_marks.get(parent.id) if archive_marks is not None else None
+        if mark is not None and (cutoff is None or mark > cutoff):
+            cutoff = mark
+        listed_at = datetime.now(timezone.utc)
+        listed = 0
+        try:
+            await request_page()
+            async for thread in parent.archived_threads(limit=None):
+                if cutoff and thread.archive_timestamp < cutoff:
+                    break
+                if thread.id not in threads and is_scannable(thread, guild):
+                    threads[thread.id] = thread
+                listed += 1
+                # The iterator requests the next page once this one is used up
+                if listed % THREAD_LIST_PAGE_SIZE == 0:
+                    await request_page()
+        except (discord.Forbidden, discord.HTTPException) as e:
+            print(f"⚠️ Error listing archived threads in #{parent.name} (ID: {parent.id}): {e}")
+            continue
+        if archive_marks is not None:
+            archive_marks[parent.id] = listed_at
+
+    return list(threads.values())
+
+
+def fold_voice_members(guild: discord.Guild, latest: Dict[int, datetime], now: datetime):
+    """Members sitting in a voice or stage channel right now are active now."""
+    for channel in [*guild.voice_channels, *guild.stage_channels]:
+        for member in channel.members:
+            fold_activity(latest, member.id, now)
+
+
+class ActivityFloor:
+    """
+    The oldest activity currently known for any member. History is read newest
+    first, so once a walk reaches messages older than this floor, nothing left
+    in that channel can change anyone's last activity and it can stop early.
+    """
+
+    def __init__(self, baseline: Dict[int, datetime]):
+        self.known = dict(baseline)
+        self._heap: List[Tuple[datetime, int]] = [(when, member_id) for member_id, when in self.known.items()]
+        heapq.heapify(self._heap)
+
+    def update(self, member_id: int, created_at: datetime):
+        known = self.known.get(member_id)
+        if known is not None and created_at > known:
+            self.known[member_id] = created_at
+            heapq.heappush(self._heap, (created_at, member_id))
+
+    def floor(self) -> Optional[datetime]:
+        # Drop entries that were superseded by a newer message
+        while self._heap and self.known[self._heap[0][1]] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+
+def fold_activity(latest: Dict[int, datetime], author_id: int, created_at: datetime):
+    """Keep the most recent timestamp seen for an author."""
+    previous = latest.get(author_id)
+    if previous is None or created_at > previous:
+        latest[author_id] = created_at
+
+
+def usable_watermark(channel, watermark: Optional[int]) -> Optional[int]:
+    """
+    A watermark can only be trusted if it belongs to this incarnation of the
+    channel; anything older than the channel itself means it was recreated.
+    """
+    if watermark is None or watermark < channel.id:
+        return None
+    return watermark
+
+
+async def scan_channel(
+    channel,
+    latest: Dict[int, datetime],
+    limit: Optional[int],
+    watermark: Optional[int] = None,
+    pacer: Optional[RequestPacer] = None,
+    metrics: Optional[Metrics] = None,
+    since: Optional[datetime] = None,
+    floor: Optional[ActivityFloor] = None,
+    progress: Optional[ChannelProgress] = None,
+    on_checkpoint: Optional[CheckpointCallback] = None,
+) -> Optional[int]:
+    """
+    Walk one channel's history once and fold every author into `latest`.
+    Only messages newer than both the watermark and `since` are fetched, and
+    with a `floor` the walk stops as soon as older messages can't matter.
+    Returns the new watermark, or None if the walk didn't finish and must not
+    be trusted.
+
+    With `progress`, a walk that was interrupted earlier continues below its
+    cursor, and `on_checkpoint` is called every CHECKPOINT_PAGES pages and
+    once the channel is done.
+    """
+    if progress is None:
+        progress = ChannelProgress(max(watermark or 0, time_snowflake(since) if since else 0), watermark)
+    after = discord.Object(id=progress.after_id) if progress.after_id else None
+    before = discord.Object(id=progress.cursor_id) if progress.cursor_id else None
+    newest = progress.newest_id
+    unsaved: Dict[int, datetime] = {}  # authors folded in since the last checkpoint
+    fetched = 0
+    started = time.perf_counter()
+    try:
+        if pacer:
+            await pacer.acquire()
+        async for msg in channel.history(limit=limit, after=after, before=before, oldest_first=False):
+            if newest is None or msg.id > newest:
+                newest = msg.id
+            if floor:
+                lowest = floor.floor()
+                if lowest is not None and msg.created_at < lowest:
+                    if metrics:
+                        metrics.inc("history_early_stops_total")
+                    break
+                floor.update(msg.author.id, msg.created_at)
+            fold_activity(latest, msg.author.id, msg.created_at)
+            fetched += 1
+            if on_checkpoint:
+                fold_activity(unsaved, msg.author.id, msg.created_at)
+                progress.cursor_id = msg.id
+                progress.newest_id = newest
+                progress.messages += 1
+                if fetched % (HISTORY_PAGE_SIZE * CHECKPOINT_PAGES) == 0:
+                    on_checkpoint(channel, progress, unsaved)
+                    unsaved = {}
+            # The iterator requests the next page once this one is used up
+            if pacer and fetched % HISTORY_PAGE_SIZE == 0:
+                await pacer.acquire()
+        progress.newest_id = newest
+        progress.done = True
+    except asyncio.TimeoutError:
+        print(f"⏰ Timeout fetching history in #{channel.name} (ID: {channel.id})")
+        newest = None
+    except (discord.Forbidden, discord.HTTPException) as e:
+        print(f"⚠️ Error reading #{channel.name} (ID: {channel.id}): {e}")
+        newest = None
+    if on_checkpoint and (progress.done or unsaved):
+        on_checkpoint(channel, progress, unsaved)
+
+    if metrics:
+        pages = fetched // HISTORY_PAGE_SIZE + 1
+        metrics.record_channel(channel.id, channel.name, fetched, pages, time.perf_counter() - started)
+        if newest is None:
+            metrics.inc("history_errors_total")
+    return newest
+
+
+def apply_join_defaults(
+    latest: Dict[int, datetime],
+    members: Iterable[discord.Member],
+    previous: Optional[Dict[int, datetime]] = None,
+) -> Dict[int, datetime]:
+    """
+    Build the per-member activity map: the newest of the messages seen and the
+    previously known activity, but never earlier than the member's join date
+    (members never seen fall back to it). Members who left are dropped.
+    """
+    previous = previous or {}
+    activity: Dict[int, datetime] = {}
+    for member in members:
+        if member.bot:
+            continue
+        last_active = member.joined_at or EPOCH
+        for seen in (latest.get(member.id), previous.get(member.id)):
+            if seen is not None and seen > last_active:
+                last_active = seen
+        activity[member.id] = last_active
+    return activity
+
+
+async def scan_channels(
+    guild: discord.Guild,
+    limit: Optional[int],
+    watermarks: Optional[Dict[int, int]] = None,
+    on_progress: Optional[Callable[[int, int, int], None]] = None,
+    concurrency: int = 1,
+    pacer: Optional[RequestPacer] = None,
+    metrics: Optional[Metrics] = None,
+    since: Optional[datetime] = None,
+    baseline: Optional[Dict[int, datetime]] = None,
+    resume: Optional[Dict[int, ChannelProgress]] = None,
+    resumed_activity: Optional[Dict[int, datetime]] = None,
+    on_checkpoint: Optional[CheckpointCallback] = None,
+    archive_marks: Optional[Dict[int, datetime]] = None,
+) -> Dict[int, datetime]:
+    """
+    Read every readable channel's history once (text channels, text-in-voice,
+    threads and forum posts) and return the newest message time per author.
+    When `watermarks` (channel ID -> last scanned message ID) is given,
+    channels with a usable watermark are only read past it (and not at all
+    if their last message is the watermark), channels without one get a
+    full lookback, and the dict is advanced in place. `archive_marks` is
+    passed on to `readable_threads()` and advanced the same way.
+
+    `since` bounds the lookback by time instead of message count: channels
+    whose last message is older are skipped without a request. `baseline`
+    (known activity per member) lets each walk stop once no older message can
+    change the result.
+
+    Up to `concurrency` channels are walked at the same time; `pacer` caps the
+    combined request rate across all of them.
+
+    To resume an interrupted scan, pass the saved per-channel `resume`
+    progress and the authors saved with it as `resumed_activity`: finished
+    channels are not read again and unfinished ones continue at their cursor.
+    What was posted in a channel after its saved newest message is read
+    first, as in a watermark walk.
+    `on_progress` gets (channels done, channels total, messages read).
+    """
+    channels = list(readable_text_channels(guild))
+    channels.extend(await readable_threads(guild, since, pacer, metrics, archive_marks))
+    total = len(channels)
+    resume = resume or {}
+    latest: Dict[int, datetime] = dict(resumed_activity or {})
+    floor = ActivityFloor(baseline) if baseline else None
+    if floor:
+        for member_id, when in latest.items():
+            floor.update(member_id, when)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+    messages = sum(progress.messages for progress in resume.values())
+
+    def report(channel, progress: ChannelProgress, unsaved: Dict[int, datetime]):
+        nonlocal messages
+        messages = sum(p.messages for p in resume.values())
+        if on_checkpoint:
+            on_checkpoint(channel, progress, unsaved)
+        if on_progress:
+            on_progress(done, total, messages)
+
+    async def worker(channel):
+        nonlocal done
+        watermark = usable_watermark(channel, watermarks.get(channel.id)) if watermarks is not None else None
+        progress = resume.get(channel.id)
+        gap = progress is not None and progress.newest_id is not None and channel.last_message_id > progress.newest_id
+        if gap:
+            # Posted after the interrupted scan last saw this channel; read it like a watermark walk
+            async with semaphore:
+                caught_up = await scan_channel(channel, latest, limit, progress.newest_id, pacer, metrics, since, floor)
+        if progress is not None and progress.done:
+            # Finished before the interruption; its authors are in `resumed_activity`
+            newest = progress.newest_id
+        elif since and snowflake_time(channel.last_message_id) < since:
+            # Nothing in here is recent enough to matter
+            newest = channel.last_message_id
+            if metrics:
+                metrics.inc("channels_skipped_total")
+        elif progress is None and watermark is not None and channel.last_message_id <= watermark:
+            # Nothing was posted since the last scan
+            newest = watermark
+            if metrics:
+                metrics.inc("channels_skipped_total")
+        else:
+            if progress is None:
+                progress = ChannelProgress(max(watermark or 0, time_snowflake(since) if since else 0), watermark)
+                resume[channel.id] = progress
+            async with semaphore:
+                newest = await scan_channel(
+                    channel, latest, limit, watermark, pacer, metrics, since, floor, progress, report,
+                )
+        if gap and newest is not None:
+            # An unread gap means nothing here may become the watermark
+            newest = max(newest, caught_up) if caught_up is not None else None
+        if watermarks is not None and newest is not None:
+            watermarks[channel.id] = newest
+        done += 1
+        if on_progress:
+            on_progress(done, total, messages)
+
+    await asyncio.gather(*(worker(channel) for channel in channels))
+    return latest
+
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+
+class CheckScheduler:
+    """
+    Runs one job per guild every `period` from a single background task.
+    Guilds are spread across the period instead of all firing together: the
+    first one runs right away and every guild added later takes the middle of
+    the largest gap between the runs already planned. A slow or failing job
+    never delays the other guilds.
+    """
+
+    def __init__(self, job: Callable[[int], Awaitable[None]], period: timedelta = timedelta(hours=24)):
+        self.job = job
+        self.period = period
+        self.next_runs: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._changed = asyncio.Event()
+
+    def add(self, guild_id: int, now: Optional[datetime] = None) -> datetime:
+        if guild_id not in self.next_runs:
+            self.next_runs[guild_id] = self._free_slot(now or datetime.now(timezone.utc))
+            self._changed.set()
+        return self.next_runs[guild_id]
+
+    def remove(self, guild_id: int):
+        if self.next_runs.pop(guild_id, None) is not None:
+            self._changed.set()
+
+    def next_run(self, guild_id: int) -> Optional[datetime]:
+        return self.next_runs.get(guild_id)
+
+    def _free_slot(self, now: datetime) -> datetime:
+        if not self.next_runs:
+            return now
+        times = sorted(self.next_runs.values())
+        # Gaps between consecutive runs, wrapping around to the first run of the next period
+        gaps = [(later - earlier, earlier) for earlier, later in zip(times, times[1:])]
+        gaps.append((times[0] + self.period - times[-1], times[-1]))
+        length, start = max(gaps)
+        slot = start + length / 2
+        while slot < now:
+            slot += self.period
+        return slot
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self._loop())
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _loop(self):
+        while True:
+            self._changed.clear()
+            now = datetime.now(timezone.utc)
+            due = [guild_id for guild_id, when in self.next_runs.items() if when <= now]
+            for guild_id in due:
+                while self.next_runs[guild_id] <= now:
+                    self.next_runs[guild_id] += self.period
+                task = asyncio.create_task(self._run(guild_id))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            timeout = None
+            if self.next_runs:
+                timeout = (min(self.next_runs.values()) - datetime.now(timezone.utc)).total_seconds()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(0.0, timeout) if timeout is not None else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, guild_id: int):
+        try:
+            await self.job(guild_id)
+        except Exception as e:
+            print(f"❌ Scheduled inactivity check for guild {guild_id} failed: {e}")